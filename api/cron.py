@@ -0,0 +1,65 @@
+import hmac
+import json
+import logging
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+from config import CRON_SECRET
+from webhook_runtime import WebhookRuntime
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Loop и пулы соединений живут, пока жив тёплый инстанс функции
+_runtime = WebhookRuntime()
+
+
+async def _run_syncs(kinds):
+    """Запускает синхронизации по очереди; пропущенные из-за блокировки отмечаются как skipped"""
+    from scheduler import run_scheduled_sync
+
+    results = {}
+    for kind in kinds:
+        result = await run_scheduled_sync(kind)
+        if result is None:
+            results[kind] = {"status": "skipped"}
+        else:
+            results[kind] = {"status": "ok" if result.success else "error", "message": result.message}
+    return results
+
+
+class handler(BaseHTTPRequestHandler):
+    """Точка входа Vercel Cron: GET /api/cron?sync=stocks,prices"""
+
+    def _send(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):  # noqa: N802
+        # Без секрета endpoint закрыт: иначе любой мог бы запускать запись в Magnit
+        authorization = self.headers.get("Authorization", "")
+        if not CRON_SECRET or not hmac.compare_digest(authorization.encode(), f"Bearer {CRON_SECRET}".encode()):
+            self._send(401, {"status": "error", "message": "unauthorized"})
+            return
+
+        from scheduler import SCHEDULED_SYNCS, enabled_syncs
+
+        query = parse_qs(urlsplit(self.path).query)
+        kinds = [kind for value in query.get("sync", []) for kind in value.split(",") if kind]
+        kinds = kinds or enabled_syncs()
+        unknown = [kind for kind in kinds if kind not in SCHEDULED_SYNCS]
+        if unknown:
+            self._send(400, {"status": "error", "message": f"unknown sync: {', '.join(unknown)}"})
+            return
+
+        try:
+            results = _runtime.run(_run_syncs(kinds))
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.exception("❌ Cron sync failed: %s", exc)
+            self._send(500, {"status": "error", "message": str(exc)})
+            return
+        self._send(200, {"status": "ok", "results": results})
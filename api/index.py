@@ -10,7 +10,8 @@ class handler(BaseHTTPRequestHandler):
         response = {
             "status": "ok",
             "message": "🤖 Magnit Bot is running on Vercel!",
-            "webhook": "/api/webhook"
+            "webhook": "/api/webhook",
+            "metrics": "/api/metrics"
         }
         body = json.dumps(response).encode("utf-8")
         self.send_response(200)
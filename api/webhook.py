@@ -1,36 +1,29 @@
-import asyncio
 import json
 import logging
+import time
 from http.server import BaseHTTPRequestHandler
 
-from bot import create_application
-from telegram import Update
+from config import WEBHOOK_FAST_ACK, METRICS_TOKEN
+from metrics import REGISTRY, CONTENT_TYPE, WEBHOOK_SECONDS, authorized
+from webhook_runtime import WebhookRuntime
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Глобальная переменная для кэширования приложения между запросами
-_application = None
-_initialized = False
-
-
-async def _get_or_create_application():
-    """Получает или создает и инициализирует Telegram Application."""
-    global _application, _initialized
-    
-    if _application is None:
-        logger.info("🔧 Creating Telegram application...")
-        _application = create_application()
-        logger.info("✅ Telegram application created")
-    
-    if not _initialized:
-        logger.info("🚀 Initializing application...")
-        await _application.initialize()
-        await _application.start()
-        _initialized = True
-        logger.info("✅ Application initialized and started")
-    
-    return _application
+# Loop и приложение живут, пока жив тёплый инстанс функции
+_runtime = WebhookRuntime()
+
+
+def _collect_queue():
+    stats = _runtime.queue_stats()
+    return [
+        ("webhook_queue_depth", "Обновлений в очереди", [({}, stats["depth"])]),
+        ("webhook_queue_oldest_age_seconds", "Возраст самого старого обновления в очереди",
+         [({}, stats["oldest_age"])]),
+    ]
+
+
+REGISTRY.register_collector(_collect_queue)
 
 
 async def _process_update_async(update_data: dict) -> None:
@@ -40,15 +33,9 @@ async def _process_update_async(update_data: dict) -> None:
         user_id = update_data['message']['from'].get('id')
         username = update_data['message']['from'].get('username', 'no username')
         logger.info(f"📨 Processing update from user {user_id} (@{username})")
-    
-    application = await _get_or_create_application()
-    
-    # Создаем Update объект из JSON
-    update = Update.de_json(update_data, application.bot)
-    
-    # Обрабатываем обновление
+
     # process_update возвращается только после завершения всех HTTP запросов
-    await application.process_update(update)
+    await _runtime.process_update(update_data)
 
 
 class handler(BaseHTTPRequestHandler):
@@ -63,8 +50,19 @@ class handler(BaseHTTPRequestHandler):
         self.wfile.write(body)
 
     def do_GET(self):  # noqa: N802
-        """Простой healthcheck."""
-        self._send(200, {"status": "ok"})
+        """Healthcheck с состоянием очереди обновлений, /api/metrics — метрики Prometheus."""
+        if self.path.split("?")[0].rstrip("/").endswith("/metrics"):
+            if not authorized(self.headers.get("Authorization"), METRICS_TOKEN):
+                self._send(401, {"status": "error", "message": "unauthorized"})
+                return
+            body = REGISTRY.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self._send(200, {"status": "ok", "fast_ack": WEBHOOK_FAST_ACK, "queue": _runtime.queue_stats()})
 
     def do_POST(self):  # noqa: N802
         """Основной webhook endpoint."""
@@ -73,21 +71,34 @@ class handler(BaseHTTPRequestHandler):
 
         try:
             update_data = json.loads(raw_body.decode("utf-8"))
-            logger.info(f"📨 Received update: {update_data.get('update_id', 'unknown')}")
-        except json.JSONDecodeError as e:
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
             logger.error(f"❌ Invalid JSON: {e}")
             self._send(400, {"status": "error", "message": "invalid json"})
             return
 
-        # Обрабатываем обновление - используем простой подход без сложной логики
+        if not isinstance(update_data, dict) or "update_id" not in update_data:
+            logger.error("❌ Payload is not a Telegram update")
+            self._send(400, {"status": "error", "message": "not an update"})
+            return
+
+        logger.info(f"📨 Received update: {update_data['update_id']}")
+
+        if WEBHOOK_FAST_ACK:
+            # Отвечаем Telegram сразу, обработка идёт в фоновой очереди
+            _runtime.enqueue(update_data)
+            self._send(200, {"status": "queued"})
+            return
+
         try:
             logger.info("🔄 Processing update...")
-            
-            # Просто запускаем обработку через asyncio.run()
-            # process_update должен ждать завершения всех HTTP запросов
-            asyncio.run(_process_update_async(update_data))
-            
-            logger.info("✅ Update processed successfully")
+            started = time.monotonic()
+
+            # Обработка идёт в постоянном loop, ждём её завершения
+            _runtime.run(_process_update_async(update_data))
+
+            elapsed = time.monotonic() - started
+            WEBHOOK_SECONDS.observe(elapsed, mode="inline")
+            logger.info(f"✅ Update processed in {elapsed * 1000:.0f} ms")
             
             # Возвращаем успешный ответ
             self._send(200, {"status": "ok"})
@@ -0,0 +1,119 @@
+"""Холодный старт webhook: время импорта и обработки первого обновления в новом процессе.
+
+Запуск из корня репозитория:
+
+    python benchmarks/cold_start.py --runs 5 --latency 0.1
+
+Каждый прогон — отдельный интерпретатор, как новый инстанс функции на Vercel.
+Сравниваются старт с запросом getMe и старт с данными бота из
+TELEGRAM_BOT_USERNAME. Telegram Bot API подменяется локальным стендом
+с задержкой --latency на каждый вызов (порядка RTT до api.telegram.org).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN_ID = 1
+
+
+def child():
+    """Замеры внутри нового процесса; результат печатается одной строкой JSON"""
+    sys.path.insert(0, ROOT)
+    started = time.perf_counter()
+    from api import webhook
+    imported = time.perf_counter()
+
+    def update(update_id):
+        return {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": ADMIN_ID, "type": "private"},
+                "from": {"id": ADMIN_ID, "is_bot": False, "first_name": "Bench"},
+                "text": "/start",
+                "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+            },
+        }
+
+    webhook._runtime.run(webhook._process_update_async(update(1)))
+    first = time.perf_counter()
+    webhook._runtime.run(webhook._process_update_async(update(2)))
+    second = time.perf_counter()
+    webhook._runtime.shutdown()
+
+    print(json.dumps({
+        "import": imported - started,
+        "first_update": first - imported,
+        "second_update": second - first,
+        "modules": len(sys.modules),
+    }))
+
+
+def run_once(env):
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child"],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    total = time.perf_counter() - started
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process"] = total
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="прогонов на режим")
+    parser.add_argument("--latency", type=float, default=0.1, help="задержка стенда Telegram, секунд")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        return
+
+    from mock_servers import MockSettings, telegram_server
+
+    telegram = telegram_server(MockSettings(latency=args.latency)).start()
+    base_env = dict(
+        os.environ,
+        TELEGRAM_BOT_TOKEN="123456:bench",
+        MAGNIT_API_KEY="bench",
+        OZON_API_KEY="bench",
+        OZON_CLIENT_ID="bench",
+        WAREHOUSE_ID="1",
+        ADMIN_IDS=str(ADMIN_ID),
+        TELEGRAM_API_BASE_URL=f"{telegram.url}/bot",
+        # Файл кэша getMe в /tmp не переживает холодный старт на Vercel
+        BOT_INFO_CACHE_PATH=os.devnull,
+        VERCEL="1",
+    )
+    base_env.pop("TELEGRAM_BOT_USERNAME", None)
+    modes = {
+        "getMe при старте": base_env,
+        "TELEGRAM_BOT_USERNAME": dict(base_env, TELEGRAM_BOT_USERNAME="bench_bot"),
+    }
+
+    print(f"{'режим':<24}{'процесс, мс':>13}{'импорт, мс':>12}{'1-е обновл., мс':>17}{'2-е, мс':>10}{'модулей':>9}")
+    try:
+        for name, env in modes.items():
+            runs = [run_once(env) for _ in range(args.runs)]
+
+            def median(key):
+                return statistics.median(run[key] for run in runs)
+
+            print(f"{name:<24}{median('process') * 1000:>13.0f}{median('import') * 1000:>12.0f}"
+                  f"{median('first_update') * 1000:>17.0f}{median('second_update') * 1000:>10.0f}"
+                  f"{median('modules'):>9.0f}")
+    finally:
+        telegram.stop()
+
+
+if __name__ == "__main__":
+    main()
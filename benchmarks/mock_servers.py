@@ -0,0 +1,225 @@
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+@dataclass
+class MockSettings:
+    """Поведение стенда: задержка ответа, доля ошибок и размеры данных"""
+    latency: float = 0.02
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    catalog_size: int = 1000
+    orders: int = 300
+    seed: int = 1
+
+
+def offer_id(i):
+    return f"SKU-{i:06d}"
+
+
+def sku_id(i):
+    return 100000 + i
+
+
+class MockServer:
+    """Локальный HTTP-сервер, отвечающий как один из внешних API.
+
+    routes — {путь или регулярное выражение: функция(payload) -> ответ}.
+    Каждый ответ задерживается на latency (+ случайный jitter), с
+    вероятностью error_rate вместо ответа отдаётся 503.
+    """
+
+    def __init__(self, name, routes, settings):
+        self.name = name
+        self.routes = [(re.compile(pattern), route) for pattern, route in routes.items()]
+        self.settings = settings
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(settings.seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f"mock-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _roll(self):
+        """Задержка и признак ошибки для очередного запроса"""
+        settings = self.settings
+        with self._lock:
+            self.requests += 1
+            delay = settings.latency + self._random.uniform(0, settings.jitter)
+            failed = self._random.random() < settings.error_rate
+            if failed:
+                self.errors += 1
+        return delay, failed
+
+    def _respond(self, path, payload):
+        for pattern, route in self.routes:
+            if pattern.fullmatch(path):
+                return 200, route(payload)
+        return 404, {"error": "not found"}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):  # noqa: N802
+                length = int(self.headers.get("Content-Length", "0"))
+                raw_body = self.rfile.read(length) if length else b""
+                try:
+                    payload = json.loads(raw_body) if raw_body else {}
+                except ValueError:
+                    # Telegram-клиент отправляет формы, их содержимое стенду не нужно
+                    payload = {}
+
+                delay, failed = server._roll()
+                time.sleep(delay)
+                if failed:
+                    status, response = 503, {"error": "service unavailable"}
+                else:
+                    status, response = server._respond(self.path, payload)
+
+                body = json.dumps(response).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def _ozon_page(settings, payload, item):
+    limit = int(payload.get("limit") or 1000)
+    start = int(payload.get("cursor") or 0)
+    end = min(start + limit, settings.catalog_size)
+    return {
+        "items": [item(i) for i in range(start, end)],
+        "cursor": str(end) if end < settings.catalog_size else "",
+        "total": settings.catalog_size,
+    }
+
+
+def ozon_server(settings):
+    """Стенд Ozon: остатки и цены с постраничной выдачей по cursor"""
+    def stocks(payload):
+        return _ozon_page(settings, payload, lambda i: {
+            "offer_id": offer_id(i),
+            "product_id": sku_id(i),
+            "stocks": [{"type": "fbs", "present": i % 50, "reserved": 0}],
+        })
+
+    def prices(payload):
+        return _ozon_page(settings, payload, lambda i: {
+            "offer_id": offer_id(i),
+            "product_id": sku_id(i),
+            "price": {"price": f"{100 + i % 900}.00", "currency_code": "RUB"},
+        })
+
+    return MockServer("ozon", {
+        "/v4/product/info/stocks": stocks,
+        "/v5/product/info/prices": prices,
+    }, settings)
+
+
+def magnit_server(settings):
+    """Стенд Magnit: каталог, заказы, остатки и цены"""
+    def product(i):
+        return {"sku_id": sku_id(i), "seller_sku_id": offer_id(i), "title": f"Товар номер {i}"}
+
+    def products(payload):
+        sku_ids = payload.get("filter", {}).get("sku_ids")
+        if sku_ids is not None:
+            indices = (sku - sku_id(0) for sku in sku_ids)
+            return {"result": [product(i) for i in indices if 0 <= i < settings.catalog_size]}
+        limit = min(int(payload.get("limit") or 1000), settings.catalog_size)
+        return {"result": [product(i) for i in range(limit)]}
+
+    def orders(payload):
+        offset = int(payload.get("offset") or 0)
+        end = min(offset + int(payload.get("limit") or 100), settings.orders)
+        return {"orders": [
+            {
+                "order_id": f"ORD-{n}",
+                "status": "NEW" if n % 3 else "ASSEMBLING",
+                "items": [{"sku_id": sku_id(n % settings.catalog_size), "quantity": 1 + n % 3}],
+            }
+            for n in range(offset, end)
+        ]}
+
+    def stocks_info(payload):
+        sku_ids = payload.get("filter", {}).get("sku_ids", [])
+        return {"result": [
+            {"sku_id": sku, "stock_info_details": [{"type": "FBS", "stock": sku % 50, "reserved": 0}]}
+            for sku in sku_ids
+        ]}
+
+    def prices_info(payload):
+        seller_sku_ids = payload.get("filter", {}).get("seller_sku_ids", [])
+        return {"result": [
+            {"seller_sku_id": seller_sku, "price": 100 + int(seller_sku.rsplit("-", 1)[-1]) % 900}
+            for seller_sku in seller_sku_ids
+        ]}
+
+    def accepted(payload):
+        return {"result": "ok"}
+
+    base = "/api/seller/v1"
+    return MockServer("magnit", {
+        f"{base}/products/sku/list": products,
+        f"{base}/orders/list/unprocessed": orders,
+        f"{base}/products/sku/stocks/info": stocks_info,
+        f"{base}/products/sku/price/info": prices_info,
+        f"{base}/products/sku/stocks": accepted,
+        f"{base}/products/sku/price": accepted,
+    }, settings)
+
+
+def telegram_server(settings):
+    """Стенд Telegram Bot API: getMe и ответ-сообщение на любой другой метод"""
+    bot_user = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+    messages = iter(range(1, 1 << 62))
+
+    def get_me(payload):
+        return {"ok": True, "result": bot_user}
+
+    def webhook(payload):
+        return {"ok": True, "result": True}
+
+    def message(payload):
+        return {"ok": True, "result": {
+            "message_id": next(messages),
+            "date": int(time.time()),
+            "chat": {"id": 1, "type": "private"},
+            "from": bot_user,
+            "text": "ok",
+        }}
+
+    return MockServer("telegram", {
+        r"/bot[^/]+/getMe": get_me,
+        r"/bot[^/]+/(setWebhook|deleteWebhook)": webhook,
+        r"/bot[^/]+/\w+": message,
+    }, settings)
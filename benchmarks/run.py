@@ -0,0 +1,297 @@
+"""Бенчмарк синхронизации, экранов и webhook на локальных стендах Magnit, Ozon и Telegram.
+
+Запуск из корня репозитория:
+
+    python benchmarks/run.py --sizes 1000,10000,100000 --latency 0.02 --error-rate 0.01
+
+Для каждого размера каталога выполняются полная и дельта-синхронизация остатков
+и цен, получение остатков из Magnit и обработка обновлений через api/webhook.
+Печатается пропускная способность, p50/p99 задержки запросов и пиковая память
+(tracemalloc).
+
+--sizes задаёт размер каталога Ozon. Колонка «строк» — сколько строк сценарий
+действительно обработал за прогон: для синхронизаций это товары Ozon, для
+экранов Magnit — товары каталога Magnit. Каталог Magnit читается одним запросом
+с limit 1000 (стенд соблюдает limit, как и настоящий API), поэтому больше 1000
+товаров экраны не обрабатывают при любом --sizes. Реальные API не используются: базовые адреса подменяются
+на адреса стендов через MAGNIT_API_BASE_URL, OZON_API_BASE_URL и TELEGRAM_API_BASE_URL.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+from mock_servers import MockSettings, magnit_server, ozon_server, telegram_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN_ID = 1
+
+
+def configure_environment(args, magnit, ozon, telegram, state_dir):
+    """Переменные окружения для config.py; задаются до импорта модулей бота"""
+    os.environ.update({
+        "TELEGRAM_BOT_TOKEN": "123456:bench",
+        "MAGNIT_API_KEY": "bench",
+        "OZON_API_KEY": "bench",
+        "OZON_CLIENT_ID": "bench",
+        "WAREHOUSE_ID": "1",
+        "ADMIN_IDS": str(ADMIN_ID),
+        "MAGNIT_API_BASE_URL": magnit.url,
+        "OZON_API_BASE_URL": ozon.url,
+        "TELEGRAM_API_BASE_URL": f"{telegram.url}/bot",
+        "SYNC_STATE_PATH": os.path.join(state_dir, "sync_state.sqlite3"),
+    })
+    # Темп отправки в Telegram меряется отдельно, здесь он не должен быть узким местом
+    for name in ("TELEGRAM_CHAT_RATE", "TELEGRAM_CHAT_BURST", "TELEGRAM_GLOBAL_RATE"):
+        os.environ.setdefault(name, "1000")
+    if args.no_rate_limit:
+        for name in ("MAGNIT_RATE_LIMIT", "MAGNIT_RATE_BURST", "OZON_RATE_LIMIT", "OZON_RATE_BURST"):
+            os.environ[name] = "100000"
+    sys.path.insert(0, ROOT)
+
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class RequestTimer:
+    """Засекает каждый запрос к API маркетплейсов, включая повторы и ожидание лимитов.
+
+    Для потоковых ответов время считается до получения заголовков.
+    """
+
+    def __init__(self):
+        self.samples = []
+
+    def wrap(self, post):
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await post(*args, **kwargs)
+            finally:
+                self.samples.append(time.perf_counter() - started)
+        return timed
+
+
+class Report:
+    """Таблица результатов; печатает в исходный stdout, пока вывод бота заглушён"""
+
+    def __init__(self):
+        self.rows = []
+        self.out = sys.stdout
+        # Размер каталога Ozon для текущих сценариев (--sizes)
+        self.catalog_size = None
+
+    def add(self, scenario, rows, durations, items, samples, peak, unit="шт"):
+        elapsed = sum(durations)
+        self.rows.append({
+            "scenario": scenario,
+            "catalog_size": self.catalog_size,
+            "rows": rows,
+            "runs": len(durations),
+            "seconds": round(elapsed / len(durations), 3),
+            "throughput": round(items / elapsed, 1) if elapsed else 0.0,
+            "unit": unit,
+            "requests": len(samples),
+            "p50_ms": round(percentile(samples, 0.50) * 1000, 1),
+            "p99_ms": round(percentile(samples, 0.99) * 1000, 1),
+            "peak_mb": round(peak / 2 ** 20, 1),
+        })
+        self.print_row(self.rows[-1])
+
+    def print(self, text):
+        print(text, file=self.out, flush=True)
+
+    def print_header(self):
+        self.print(f"{'сценарий':<26}{'строк':>8}{'с/прогон':>10}{'в секунду':>14}{'запросов':>10}"
+                   f"{'p50, мс':>10}{'p99, мс':>10}{'пик, МБ':>10}")
+
+    def print_row(self, row):
+        throughput = f"{row['throughput']} {row['unit']}"
+        self.print(f"{row['scenario']:<26}{row['rows']:>8}{row['seconds']:>10}{throughput:>14}{row['requests']:>10}"
+                   f"{row['p50_ms']:>10}{row['p99_ms']:>10}{row['peak_mb']:>10}")
+
+
+async def measure(report, scenario, repeat, timer, action, before=None):
+    """Выполняет action repeat раз; action возвращает число обработанных строк"""
+    durations, items, peak = [], 0, 0
+    timer.samples.clear()
+    for _ in range(repeat):
+        if before:
+            await before()
+        tracemalloc.reset_peak()
+        started = time.perf_counter()
+        items += await action()
+        durations.append(time.perf_counter() - started)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+    report.add(scenario, items // repeat, durations, items, list(timer.samples), peak)
+
+
+async def run_api_scenarios(report, repeat, timer):
+    """Сценарии синхронизации и экранов; возвращает число товаров в каталоге Magnit"""
+    import magnit_api
+
+    magnit_api.invalidate_catalog()
+    catalog_rows = len(await magnit_api.get_all_products())
+    report.print(f"каталог: Ozon {report.catalog_size} SKU, Magnit {catalog_rows} товаров")
+
+    async def full_stocks():
+        result = await magnit_api.sync_stocks_with_magnit(full=True)
+        if not result.success:
+            report.print(f"  ⚠️ {result.message.splitlines()[0]}")
+        return result.total
+
+    async def delta_stocks():
+        result = await magnit_api.sync_stocks_with_magnit()
+        return result.total + result.unchanged
+
+    async def full_prices():
+        result = await magnit_api.sync_prices_with_magnit(full=True)
+        if not result.success:
+            report.print(f"  ⚠️ {result.message.splitlines()[0]}")
+        return result.total
+
+    async def delta_prices():
+        result = await magnit_api.sync_prices_with_magnit()
+        return result.total + result.unchanged
+
+    async def stocks_info():
+        return (await magnit_api.get_stocks_info()).count("stock")
+
+    async def cold_catalog():
+        magnit_api.invalidate_catalog()
+
+    await measure(report, "sync_stocks full", repeat, timer, full_stocks)
+    await measure(report, "sync_stocks delta", repeat, timer, delta_stocks)
+    await measure(report, "sync_prices full", repeat, timer, full_prices)
+    await measure(report, "sync_prices delta", repeat, timer, delta_prices)
+    await measure(report, "get_stocks_info", repeat, timer, stocks_info, before=cold_catalog)
+
+    from http_client import close_clients
+    await close_clients()
+    return catalog_rows
+
+
+def _update(update_id, text):
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": ADMIN_ID, "type": "private"},
+        "from": {"id": ADMIN_ID, "is_bot": False, "first_name": "Bench"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+    return {"update_id": update_id, "message": message}
+
+
+def run_webhook_scenario(report, updates, rows):
+    """Отправляет обновления в api/webhook по HTTP и засекает ответ на каждое.
+
+    rows — сколько строк обрабатывает одно обновление каждого вида.
+    """
+    from api import webhook
+
+    class QuietHandler(webhook.handler):
+        def log_message(self, format, *args):
+            pass
+
+    # api/webhook включает INFO-логирование при импорте
+    logging.getLogger().setLevel(logging.WARNING)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = "http://{}:{}/api/webhook".format(*server.server_address)
+
+    def post(update):
+        request = urllib.request.Request(
+            url, data=json.dumps(update).encode("utf-8"), headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request) as response:
+            response.read()
+
+    try:
+        # Первое обновление инициализирует приложение (getMe), его не учитываем
+        post(_update(0, "/start"))
+        for text in rows:
+            samples = []
+            tracemalloc.reset_peak()
+            for update_id in range(1, updates + 1):
+                started = time.perf_counter()
+                post(_update(update_id, text))
+                samples.append(time.perf_counter() - started)
+            peak = tracemalloc.get_traced_memory()[1]
+            report.add(f"webhook {text}", rows[text], [sum(samples)], updates, samples, peak, unit="upd")
+    finally:
+        server.shutdown()
+        server.server_close()
+        webhook._runtime.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000", help="размеры каталога через запятую")
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка ответа стендов, секунд")
+    parser.add_argument("--jitter", type=float, default=0.005, help="случайная добавка к задержке, секунд")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503 от Magnit и Ozon")
+    parser.add_argument("--orders", type=int, default=300, help="число необработанных заказов")
+    parser.add_argument("--repeat", type=int, default=3, help="прогонов каждого сценария")
+    parser.add_argument("--webhook-updates", type=int, default=20, help="обновлений на сценарий webhook")
+    parser.add_argument("--no-rate-limit", action="store_true", help="снять ограничение частоты запросов")
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    args = parser.parse_args()
+
+    settings = MockSettings(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, orders=args.orders
+    )
+    telegram_settings = MockSettings(latency=args.latency, jitter=args.jitter)
+    servers = [magnit_server(settings).start(), ozon_server(settings).start(),
+               telegram_server(telegram_settings).start()]
+
+    with tempfile.TemporaryDirectory() as state_dir:
+        configure_environment(args, *servers, state_dir)
+        import http_client
+
+        timer = RequestTimer()
+        http_client._send = timer.wrap(http_client._send)
+
+        tracemalloc.start()
+        report = Report()
+        report.print_header()
+        # Сообщения бота о ходе синхронизации не смешиваем с таблицей
+        try:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                for size in (int(size) for size in args.sizes.split(",")):
+                    settings.catalog_size = report.catalog_size = size
+                    catalog_rows = asyncio.run(run_api_scenarios(report, args.repeat, timer))
+                    # Экран заказов обходит все заказы, экран остатков — весь каталог Magnit
+                    rows = {"/start": 0, "📦 Новые заказы": args.orders, "📊 Текущие остатки": catalog_rows}
+                    run_webhook_scenario(report, args.webhook_updates, rows)
+        finally:
+            tracemalloc.stop()
+            for server in servers:
+                server.stop()
+
+    errors = sum(server.errors for server in servers)
+    requests = sum(server.requests for server in servers)
+    print(f"\nЗапросов к стендам: {requests}, из них ошибок 503: {errors}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report.rows, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,54 @@
 import logging
 import asyncio
+import importlib
+import time
 from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from config import TELEGRAM_BOT_TOKEN, ADMIN_IDS
-
-from handlers.orders import show_orders
-from handlers.stocks import (
-    show_stocks_menu, sync_stocks, start_stock_edit,
-    handle_stock_product_selection, handle_stock_value_input, show_current_stocks
+from telegram.ext import (
+    Application, CommandHandler, MessageHandler, CallbackQueryHandler, TypeHandler, filters, ContextTypes
 )
-from handlers.prices import (
-    show_prices_menu, sync_prices, start_price_edit,
-    handle_price_product_selection, handle_price_value_input, show_current_prices
+from telegram.request import HTTPXRequest
+from config import (
+    TELEGRAM_BOT_TOKEN, TELEGRAM_API_BASE_URL, ADMIN_IDS, METRICS_PORT, METRICS_TOKEN,
+    UPDATE_CONCURRENCY, UPDATE_MAX_PENDING,
 )
 
+from cached_bot import CachedBot
+from persistence import create_persistence, save_user_state
 from keyboards import get_main_keyboard, get_sync_keyboard
-from magnit_api import sync_stocks_with_magnit, sync_prices_with_magnit
+from messaging import reply
+from http_client import close_clients
+from metrics import observe_handler, serve_metrics
+from scheduler import schedule_syncs
+from update_processor import ChatOrderedUpdateProcessor
+
+
+def _lazy(module_name, name):
+    """Обработчик, модуль которого импортируется при первом вызове.
+
+    Модули обработчиков тянут за собой magnit_api, каталог и снимок
+    синхронизации; на холодном старте их загрузка откладывается до
+    первого обновления, которому они нужны.
+    """
+    async def handler(*args, **kwargs):
+        return await getattr(importlib.import_module(module_name), name)(*args, **kwargs)
+    handler.__name__ = name
+    return handler
+
+
+show_orders = _lazy("handlers.orders", "show_orders")
+show_stocks_menu = _lazy("handlers.stocks", "show_stocks_menu")
+sync_stocks = _lazy("handlers.stocks", "sync_stocks")
+start_stock_edit = _lazy("handlers.stocks", "start_stock_edit")
+handle_stock_product_selection = _lazy("handlers.stocks", "handle_stock_product_selection")
+handle_stock_value_input = _lazy("handlers.stocks", "handle_stock_value_input")
+show_current_stocks = _lazy("handlers.stocks", "show_current_stocks")
+show_prices_menu = _lazy("handlers.prices", "show_prices_menu")
+sync_prices = _lazy("handlers.prices", "sync_prices")
+start_price_edit = _lazy("handlers.prices", "start_price_edit")
+handle_price_product_selection = _lazy("handlers.prices", "handle_price_product_selection")
+handle_price_value_input = _lazy("handlers.prices", "handle_price_value_input")
+show_current_prices = _lazy("handlers.prices", "show_current_prices")
+handle_picker_callback = _lazy("handlers.picker", "handle_picker_callback")
 
 # Настройка логирования
 logging.basicConfig(
@@ -38,7 +71,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if not is_admin(user_id):
         logger.warning(f"❌ Access denied for user {user_id}")
-        await update.message.reply_text("❌ У вас нет доступа к этому боту")
+        await reply(update.message, "❌ У вас нет доступа к этому боту")
         return
 
     welcome_text = (
@@ -51,18 +84,30 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Выберите действие:"
     )
 
-    await update.message.reply_text(welcome_text, reply_markup=get_main_keyboard())
+    await reply(update.message, welcome_text, reply_markup=get_main_keyboard())
 
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик текстовых сообщений"""
     if not is_admin(update.effective_user.id):
-        await update.message.reply_text("❌ У вас нет доступа к этому боту")
+        await reply(update.message, "❌ У вас нет доступа к этому боту")
         return
 
     text = update.message.text
     user_state = context.user_data.get('state')
 
+    if text == "⬅️ Назад":
+        # Сбрасываем состояние при возврате в главное меню
+        context.user_data.pop('state', None)
+        context.user_data.pop('selected_product', None)
+
+        await reply(
+            update.message,
+            "Главное меню:",
+            reply_markup=get_main_keyboard()
+        )
+        return
+
     # Проверяем состояния пользователя из context.user_data
     if user_state == 'waiting_stock_product':
         await handle_stock_product_selection(update, context)
@@ -82,7 +127,8 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await show_orders(update, context)
 
     elif text == "🔄 Синхронизация":
-        await update.message.reply_text(
+        await reply(
+            update.message,
             "🔄 Синхронизация данных\n\nВыберите действие:",
             reply_markup=get_sync_keyboard()
         )
@@ -126,43 +172,75 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif text == "✏️ Изменить цену":
         await start_price_edit(update, context)
 
-    elif text == "⬅️ Назад":
-        # Сбрасываем состояние при возврате в главное меню
-        context.user_data.pop('state', None)
-        context.user_data.pop('products', None)
-        context.user_data.pop('selected_product', None)
-        context.user_data.pop('selected_title', None)
-
-        await update.message.reply_text(
-            "Главное меню:",
-            reply_markup=get_main_keyboard()
-        )
-
     else:
-        await update.message.reply_text(
+        await reply(
+            update.message,
             "Не понимаю команду. Используйте кнопки меню.",
             reply_markup=get_main_keyboard()
         )
 
 
-async def sync_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Синхронизирует всё"""
-    await update.message.reply_text("🔄 Начинаю полную синхронизацию...")
+async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик нажатий инлайн-кнопок"""
+    if not is_admin(update.effective_user.id):
+        await update.callback_query.answer("❌ У вас нет доступа к этому боту", show_alert=True)
+        return
+
+    await handle_picker_callback(update, context)
 
-    # Синхронизация остатков
-    success_stocks, message_stocks = sync_stocks_with_magnit()
-    stocks_msg = f"📊 Остатки: {'✅' if success_stocks else '❌'} {message_stocks}\n"
-    await update.message.reply_text(stocks_msg)
 
-    # Синхронизация цен
-    success_prices, message_prices = sync_prices_with_magnit()
-    prices_msg = f"💰 Цены: {'✅' if success_prices else '❌'} {message_prices}\n"
-    await update.message.reply_text(prices_msg)
+@observe_handler
+async def sync_all(update: Update, context: ContextTypes.DEFAULT_TYPE, full: bool = False):
+    """Синхронизирует остатки и цены параллельно"""
+    from magnit_api import start_sync_all
 
-    if success_stocks and success_prices:
-        await update.message.reply_text("🎉 Полная синхронизация завершена успешно!")
+    started = time.monotonic()
+    run, (stocks_joined, prices_joined) = start_sync_all(full)
+    if stocks_joined and prices_joined:
+        await reply(update.message, "⏳ Синхронизация уже идёт, дождусь её результата...")
+    elif stocks_joined or prices_joined:
+        running = "остатков" if stocks_joined else "цен"
+        await reply(update.message, f"🔄 Начинаю полную синхронизацию (синхронизация {running} уже идёт, присоединяюсь к ней)...")
     else:
-        await update.message.reply_text("⚠️ Синхронизация завершена с ошибками")
+        await reply(update.message, "🔄 Начинаю полную синхронизацию...")
+
+    stocks_result, prices_result = await run
+    elapsed = time.monotonic() - started
+    logger.info(
+        f"⏱ Синхронизация: остатки {stocks_result.duration:.2f} с, "
+        f"цены {prices_result.duration:.2f} с, всего {elapsed:.2f} с"
+    )
+
+    await reply(
+        update.message,
+        f"📊 Остатки: {'✅' if stocks_result.success else '❌'} {stocks_result.message} "
+        f"({stocks_result.duration:.1f} с)\n"
+        f"💰 Цены: {'✅' if prices_result.success else '❌'} {prices_result.message} "
+        f"({prices_result.duration:.1f} с)"
+    )
+
+    if stocks_result.success and prices_result.success:
+        await reply(update.message, f"🎉 Полная синхронизация завершена успешно за {elapsed:.1f} с!")
+    else:
+        await reply(update.message, f"⚠️ Синхронизация завершена с ошибками за {elapsed:.1f} с")
+
+
+async def orders_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /orders [STATUS ...]: заказы, при необходимости только с указанными статусами"""
+    if not is_admin(update.effective_user.id):
+        await reply(update.message, "❌ У вас нет доступа к этому боту")
+        return
+
+    await show_orders(update, context)
+
+
+async def full_sync(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /fullsync: отправляет весь каталог, не сверяясь со снимком"""
+    if not is_admin(update.effective_user.id):
+        await reply(update.message, "❌ У вас нет доступа к этому боту")
+        return
+
+    await sync_all(update, context, full=True)
 
 
 async def show_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -172,23 +250,32 @@ async def show_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "📦 <b>Новые заказы</b> - просмотр необработанных заказов\n"
         "📊 <b>Остатки</b> - управление остатками товаров\n"
         "💰 <b>Цены</b> - управление ценами товаров\n"
-        "🔄 <b>Синхронизация</b> - синхронизация данных с Ozon\n\n"
+        "🔄 <b>Синхронизация</b> - синхронизация данных с Ozon\n"
+        "/orders STATUS - заказы только с указанными статусами\n"
+        "/orders file - все заказы одним файлом\n"
+        "/fullsync - отправить весь каталог, а не только изменения\n\n"
         "<i>Для работы бота требуется доступ к API Magnit и Ozon</i>"
     )
-    await update.message.reply_text(help_text, parse_mode='HTML')
+    await reply(update.message, help_text, parse_mode='HTML')
 
 
 async def get_my_id(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда для получения своего ID"""
     user_id = update.effective_user.id
-    await update.message.reply_text(f"🆔 Ваш ID: {user_id}\n\nДобавьте его в ADMIN_IDS в файле .env")
+    await reply(update.message, f"🆔 Ваш ID: {user_id}\n\nДобавьте его в ADMIN_IDS в файле .env")
 
 
 def register_handlers(application: Application) -> None:
     """Добавляет все обработчики в экземпляр Application."""
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("myid", get_my_id))
+    application.add_handler(CommandHandler("orders", orders_command))
+    application.add_handler(CommandHandler("fullsync", full_sync))
+    application.add_handler(CallbackQueryHandler(handle_callback))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    if application.persistence is not None:
+        # Группа 1 выполняется после основных обработчиков: состояние сохраняется до ответа webhook
+        application.add_handler(TypeHandler(Update, save_user_state), group=1)
 
 
 def create_application() -> Application:
@@ -196,7 +283,20 @@ def create_application() -> Application:
     if not TELEGRAM_BOT_TOKEN:
         raise RuntimeError("TELEGRAM_BOT_TOKEN is not set")
 
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    # CachedBot берёт данные бота из кэша, а не из getMe; пулы — как у ApplicationBuilder по умолчанию
+    bot = CachedBot(
+        TELEGRAM_BOT_TOKEN,
+        base_url=TELEGRAM_API_BASE_URL,
+        request=HTTPXRequest(connection_pool_size=256),
+        get_updates_request=HTTPXRequest(),
+    )
+    builder = Application.builder().bot(bot).concurrent_updates(
+        ChatOrderedUpdateProcessor(UPDATE_CONCURRENCY, UPDATE_MAX_PENDING)
+    )
+    persistence = create_persistence()
+    if persistence is not None:
+        builder = builder.persistence(persistence)
+    application = builder.build()
     register_handlers(application)
     return application
 
@@ -210,9 +310,13 @@ async def initialize_application() -> Application:
 
 
 async def process_update_with_application(update_data: dict, application: Application) -> None:
-    """Обрабатывает обновление Telegram, используя готовое приложение."""
+    """Обрабатывает обновление Telegram, используя готовое приложение.
+
+    Обновление проходит через update_processor, как в режиме polling:
+    одновременные запросы webhook из одного чата выполняются по очереди.
+    """
     update = Update.de_json(update_data, application.bot)
-    await application.process_update(update)
+    await application.update_processor.process_update(update, application.process_update(update))
 
 
 async def main_async():
@@ -226,6 +330,9 @@ async def main_async():
         return
 
     print("✅ Бот инициализирован! Запускаем polling...")
+    if METRICS_PORT:
+        serve_metrics(METRICS_PORT, METRICS_TOKEN)
+    schedule_syncs(application)
 
     await application.initialize()
     await application.start()
@@ -245,6 +352,7 @@ async def main_async():
         await application.updater.stop()
         await application.stop()
         await application.shutdown()
+        await close_clients()
         print("👋 Бот остановлен")
 
 
@@ -258,6 +366,10 @@ async def simple_main():
         print(f"❌ ERROR: {error}")
         return
 
+    if METRICS_PORT:
+        serve_metrics(METRICS_PORT, METRICS_TOKEN)
+    schedule_syncs(application)
+
     try:
         await application.initialize()
         await application.start()
@@ -274,6 +386,7 @@ async def simple_main():
         await application.updater.stop()
         await application.stop()
         await application.shutdown()
+        await close_clients()
 
 
 def main():
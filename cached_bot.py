@@ -0,0 +1,60 @@
+import json
+import logging
+
+from telegram import User
+from telegram.ext import ExtBot
+
+from config import TELEGRAM_BOT_USERNAME, BOT_INFO_CACHE_PATH
+
+logger = logging.getLogger(__name__)
+
+
+class CachedBot(ExtBot):
+    """ExtBot, который не ходит в getMe при каждом холодном старте.
+
+    Bot.initialize() вызывает get_me() ради данных бота. Здесь они берутся из
+    TELEGRAM_BOT_USERNAME или из файла кэша, и только если их нет —
+    запрашиваются у Telegram и сохраняются в кэш.
+    """
+
+    @property
+    def _bot_id(self):
+        return int(self.token.split(":", 1)[0])
+
+    def _cached_user(self):
+        if TELEGRAM_BOT_USERNAME:
+            data = {
+                "id": self._bot_id,
+                "is_bot": True,
+                "first_name": TELEGRAM_BOT_USERNAME,
+                "username": TELEGRAM_BOT_USERNAME,
+            }
+            return User.de_json(data, self)
+
+        try:
+            with open(BOT_INFO_CACHE_PATH, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("id") != self._bot_id:
+            return None
+        return User.de_json(data, self)
+
+    def _save_user(self, user):
+        try:
+            with open(BOT_INFO_CACHE_PATH, "w", encoding="utf-8") as f:
+                json.dump(user.to_dict(), f)
+        except OSError as e:
+            logger.warning(f"⚠️ Не удалось сохранить данные бота: {e}")
+
+    async def get_me(self, *args, **kwargs):
+        if self._bot_user is None and not args and not kwargs:
+            user = self._cached_user()
+            if user is not None:
+                self._bot_user = user
+                return user
+
+        user = await super().get_me(*args, **kwargs)
+        if not TELEGRAM_BOT_USERNAME:
+            self._save_user(user)
+        return user
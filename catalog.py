@@ -0,0 +1,164 @@
+import math
+import re
+import sys
+from array import array
+from bisect import bisect_left
+
+_WORD_RE = re.compile(r"\w+")
+
+# Нет значения в целочисленном столбце (остатки не бывают отрицательными)
+MISSING = -1
+
+
+def _words(text):
+    return _WORD_RE.findall(text.lower())
+
+
+def _prefix_range(keys, prefix):
+    """Срез отсортированного списка ключей, начинающихся с prefix"""
+    start = bisect_left(keys, prefix)
+    end = start
+    while end < len(keys) and keys[end].startswith(prefix):
+        end += 1
+    return start, end
+
+
+def _to_sku_id(sku_id):
+    try:
+        return int(sku_id)
+    except (TypeError, ValueError):
+        return None
+
+
+class Catalog:
+    """Каталог товаров в параллельных массивах.
+
+    Строка i — товар sku_ids[i] с артикулом seller_skus[i] и названием
+    titles[i], строки отсортированы по артикулу. Остатки и цены хранятся
+    в CatalogColumns, выровненных по тем же строкам, поэтому соединение
+    каталога с ними — обращение по номеру строки.
+
+    Поиск по префиксу артикула и по словам названия идёт бинарным поиском
+    по отсортированным ключам; индекс строится при первом поиске.
+    """
+
+    __slots__ = ("sku_ids", "seller_skus", "titles", "_rows", "_sku_keys", "_sku_rows", "_words", "_postings")
+
+    def __init__(self, records=()):
+        """records — (sku_id, seller_sku_id, title) в любом порядке"""
+        records = sorted(
+            ((sku_id, sys.intern(str(seller_sku)), sys.intern(str(title))) for sku_id, seller_sku, title in records),
+            key=lambda record: record[1],
+        )
+        self.sku_ids = array("q", (sku_id for sku_id, _, _ in records))
+        self.seller_skus = [seller_sku for _, seller_sku, _ in records]
+        self.titles = [title for _, _, title in records]
+        self._rows = {sku_id: row for row, sku_id in enumerate(self.sku_ids)}
+        self._sku_keys = None
+        self._sku_rows = None
+        self._words = None
+        self._postings = None
+
+    def __len__(self):
+        return len(self.sku_ids)
+
+    def row(self, sku_id):
+        """Номер строки товара по sku_id (число или строка) или None"""
+        return self._rows.get(_to_sku_id(sku_id))
+
+    def _build_index(self):
+        # (артикул в нижнем регистре, номер строки) для поиска по префиксу
+        sku_pairs = sorted((seller_sku.lower(), row) for row, seller_sku in enumerate(self.seller_skus))
+        self._sku_keys = [key for key, _ in sku_pairs]
+        self._sku_rows = array("l", (row for _, row in sku_pairs))
+
+        # слово названия -> номера строк
+        postings = {}
+        for row, title in enumerate(self.titles):
+            for word in set(_words(title)):
+                postings.setdefault(word, array("l")).append(row)
+        self._words = sorted(postings)
+        self._postings = [postings[word] for word in self._words]
+
+    def _by_sku_prefix(self, prefix):
+        start, end = _prefix_range(self._sku_keys, prefix)
+        return set(self._sku_rows[start:end])
+
+    def _by_title_word(self, prefix):
+        start, end = _prefix_range(self._words, prefix)
+        rows = set()
+        for postings in self._postings[start:end]:
+            rows.update(postings)
+        return rows
+
+    def search(self, query, limit=None):
+        """Строки товаров, у которых артикул начинается с query или в названии есть все слова query.
+
+        Слова запроса сравниваются с началом слов названия. Возвращает
+        номера строк в порядке каталога.
+        """
+        query = query.strip().lower()
+        if not query:
+            return []
+        if self._sku_keys is None:
+            self._build_index()
+
+        found = self._by_sku_prefix(query)
+        words = _words(query)
+        if words:
+            by_title = self._by_title_word(words[0])
+            for word in words[1:]:
+                if not by_title:
+                    break
+                by_title &= self._by_title_word(word)
+            found |= by_title
+
+        rows = sorted(found)
+        return rows[:limit] if limit is not None else rows
+
+
+class CatalogColumns:
+    """Числовые столбцы (остаток, резерв, цена), выровненные по строкам каталога.
+
+    Отсутствующее значение — MISSING в целочисленных столбцах и NaN в дробных.
+    """
+
+    __slots__ = ("catalog", "_columns")
+
+    def __init__(self, catalog, **typecodes):
+        """typecodes — имя столбца -> код типа array ('q' — целые, 'd' — дробные)"""
+        self.catalog = catalog
+        self._columns = {
+            name: array(typecode, [self._missing(typecode)]) * len(catalog)
+            for name, typecode in typecodes.items()
+        }
+
+    @staticmethod
+    def _missing(typecode):
+        return math.nan if typecode == "d" else MISSING
+
+    def set(self, row, **values):
+        for name, value in values.items():
+            self._columns[name][row] = value
+
+    def get(self, row, name, default=None):
+        value = self._columns[name][row]
+        if value == MISSING or value != value:
+            return default
+        return value
+
+    def count(self, name):
+        """Сколько строк имеют значение в столбце"""
+        return sum(1 for value in self._columns[name] if value != MISSING and value == value)
+
+    def aligned(self, catalog):
+        """Те же значения, выровненные по строкам другой версии каталога"""
+        if catalog is self.catalog:
+            return self
+        columns = CatalogColumns(catalog, **{name: column.typecode for name, column in self._columns.items()})
+        for old_row, sku_id in enumerate(self.catalog.sku_ids):
+            row = catalog.row(sku_id)
+            if row is not None:
+                for name, column in self._columns.items():
+                    columns._columns[name][row] = column[old_row]
+        return columns
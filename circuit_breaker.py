@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Автомат разомкнут: запрос не выполняется, чтобы не ждать таймаута"""
+
+
+class CircuitBreaker:
+    """Автомат для одного эндпоинта.
+
+    После failure_threshold ошибок подряд размыкается и перестаёт пропускать
+    запросы. Через reset_timeout разрешается одна пробная попытка (half-open):
+    успех замыкает автомат, ошибка снова размыкает его.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow_request(self):
+        return self.state == self.CLOSED
+
+    def probe_due(self):
+        """Пора ли сделать пробный запрос в разомкнутом состоянии"""
+        return self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout
+
+    def start_probe(self):
+        self.state = self.HALF_OPEN
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info(f"✅ {self.name}: автомат замкнут")
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"⚡ {self.name}: автомат разомкнут после {self.failures} ошибок")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class GuardedRead:
+    """Чтение через автомат с отдачей последних удачных данных (stale-while-revalidate).
+
+    Пока автомат разомкнут, fetch() сразу бросает CircuitOpenError, а пробный
+    запрос выполняется в фоне и при успехе обновляет сохранённые данные.
+    revalidate — чтение для пробного запроса (по умолчанию fetch): ему
+    можно дать больше времени и повторов, ведь пользователь его не ждёт.
+    """
+
+    def __init__(self, name, fetch, failure_threshold, reset_timeout, revalidate=None):
+        self.name = name
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        self._fetch = fetch
+        self._revalidate_fetch = revalidate or fetch
+        self._probe = None
+        self.value = None
+        self.fetched_at = None
+        self.last_failed = False
+
+    def check(self):
+        """Бросает CircuitOpenError, если запрос сейчас выполнять нельзя"""
+        if self.breaker.allow_request():
+            return
+        if self.breaker.probe_due() and self._probe is None:
+            self.breaker.start_probe()
+            self._probe = asyncio.ensure_future(self._revalidate())
+        raise CircuitOpenError(f"{self.name}: сервис временно недоступен")
+
+    def succeeded(self, value):
+        self.responded()
+        self.value = value
+        self.fetched_at = time.time()
+
+    def responded(self):
+        """Отмечает удачный запрос, не заменяя сохранённые данные (например, прочитана только часть)"""
+        self.breaker.record_success()
+        self.last_failed = False
+
+    def failed(self):
+        self.breaker.record_failure()
+        self.last_failed = True
+
+    async def fetch(self):
+        """Выполняет чтение через автомат; ошибки чтения пробрасываются"""
+        self.check()
+        try:
+            value = await self._fetch()
+        except Exception:
+            self.failed()
+            raise
+        self.succeeded(value)
+        return value
+
+    async def _revalidate(self):
+        try:
+            value = await self._revalidate_fetch()
+        except Exception as e:
+            logger.warning(f"⚡ {self.name}: пробный запрос не удался: {e}")
+            self.failed()
+        else:
+            self.succeeded(value)
+        finally:
+            self._probe = None
+
+    def fallback(self, default):
+        """Последние удачные данные или default, если их нет"""
+        return self.value if self.value is not None else default
+
+    def stale_since(self):
+        """Время получения отдаваемых данных, если они устарели, иначе None"""
+        if self.last_failed and self.fetched_at is not None:
+            return self.fetched_at
+        return None
@@ -1,7 +1,11 @@
+import json
 import os
-from dotenv import load_dotenv
+import tempfile
 
-load_dotenv()
+# На Vercel переменные задаёт платформа, .env не ищем, чтобы не тратить время холодного старта
+if not os.getenv("VERCEL"):
+    from dotenv import load_dotenv
+    load_dotenv()
 
 
 def _get_required_env(name: str) -> str:
@@ -11,6 +15,28 @@ def _get_required_env(name: str) -> str:
     return value
 
 
+def _get_warehouse_mapping():
+    """Разбирает WAREHOUSE_MAPPING: склад Magnit -> отбор остатков Ozon по типу и складам Ozon.
+
+    Пример: {"101": {"types": ["fbs"], "ozon_warehouses": [22000001]}, "102": {"types": ["fbo"]}}.
+    Пустой список в правиле означает "любой".
+    """
+    raw = os.getenv("WAREHOUSE_MAPPING", "").strip()
+    if not raw:
+        return {}
+    try:
+        mapping = json.loads(raw)
+        return {
+            str(warehouse_id): {
+                "types": {str(stock_type).lower() for stock_type in rule.get("types", [])},
+                "ozon_warehouses": {int(ozon_id) for ozon_id in rule.get("ozon_warehouses", [])},
+            }
+            for warehouse_id, rule in mapping.items()
+        }
+    except (ValueError, TypeError, AttributeError) as e:
+        raise RuntimeError(f"WAREHOUSE_MAPPING is invalid: {e}")
+
+
 TELEGRAM_BOT_TOKEN = _get_required_env("TELEGRAM_BOT_TOKEN")
 
 admin_ids_raw = os.getenv("ADMIN_IDS", "")
@@ -29,14 +55,115 @@ else:
 MAGNIT_API_KEY = _get_required_env("MAGNIT_API_KEY")
 OZON_API_KEY = _get_required_env("OZON_API_KEY")
 OZON_CLIENT_ID = _get_required_env("OZON_CLIENT_ID")
-WAREHOUSE_ID = _get_required_env("WAREHOUSE_ID")
-
-MAGNIT_STOCKS_URL = "https://b2b-api.magnit.ru/api/seller/v1/products/sku/stocks"
-MAGNIT_PRICES_URL = "https://b2b-api.magnit.ru/api/seller/v1/products/sku/price"
-ORDERS_LIST_URL = "https://b2b-api.magnit.ru/api/seller/v1/orders/list/unprocessed"
-PRODUCTS_URL = "https://b2b-api.magnit.ru/api/seller/v1/products/sku/list"
-OZON_STOCKS_URL = "https://api-seller.ozon.ru/v4/product/info/stocks"
-OZON_PRICES_URL = "https://api-seller.ozon.ru/v5/product/info/prices"
+# Склады Magnit, куда раскладываются остатки Ozon. Без WAREHOUSE_MAPPING все остатки
+# товара суммируются в WAREHOUSE_ID. Ручное изменение остатка идёт в WAREHOUSE_ID
+# (по умолчанию — первый склад из WAREHOUSE_MAPPING)
+WAREHOUSE_MAPPING = _get_warehouse_mapping()
+WAREHOUSE_ID = os.getenv("WAREHOUSE_ID") or next(iter(WAREHOUSE_MAPPING), None) or _get_required_env("WAREHOUSE_ID")
+if not WAREHOUSE_MAPPING:
+    WAREHOUSE_MAPPING = {WAREHOUSE_ID: {"types": set(), "ozon_warehouses": set()}}
+
+# Базовые адреса API можно переопределить, например, для локальных стендов и бенчмарков
+MAGNIT_API_BASE_URL = os.getenv("MAGNIT_API_BASE_URL", "https://b2b-api.magnit.ru").rstrip("/")
+OZON_API_BASE_URL = os.getenv("OZON_API_BASE_URL", "https://api-seller.ozon.ru").rstrip("/")
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL", "https://api.telegram.org/bot")
+
+# Данные бота без запроса getMe при старте: username из переменной или файл кэша
+TELEGRAM_BOT_USERNAME = os.getenv("TELEGRAM_BOT_USERNAME", "").lstrip("@")
+BOT_INFO_CACHE_PATH = os.getenv("BOT_INFO_CACHE_PATH", os.path.join(tempfile.gettempdir(), "fbs_bot_info.json"))
+
+MAGNIT_STOCKS_URL = f"{MAGNIT_API_BASE_URL}/api/seller/v1/products/sku/stocks"
+MAGNIT_PRICES_URL = f"{MAGNIT_API_BASE_URL}/api/seller/v1/products/sku/price"
+MAGNIT_STOCKS_INFO_URL = f"{MAGNIT_API_BASE_URL}/api/seller/v1/products/sku/stocks/info"
+MAGNIT_PRICES_INFO_URL = f"{MAGNIT_API_BASE_URL}/api/seller/v1/products/sku/price/info"
+ORDERS_LIST_URL = f"{MAGNIT_API_BASE_URL}/api/seller/v1/orders/list/unprocessed"
+PRODUCTS_URL = f"{MAGNIT_API_BASE_URL}/api/seller/v1/products/sku/list"
+OZON_STOCKS_URL = f"{OZON_API_BASE_URL}/v4/product/info/stocks"
+OZON_PRICES_URL = f"{OZON_API_BASE_URL}/v5/product/info/prices"
+
+# Пул HTTP-соединений к API маркетплейсов
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "10"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "5"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+
+# Пакетная отправка остатков и цен в Magnit
+MAGNIT_UPLOAD_CHUNK_SIZE = int(os.getenv("MAGNIT_UPLOAD_CHUNK_SIZE", "500"))
+MAGNIT_UPLOAD_CONCURRENCY = int(os.getenv("MAGNIT_UPLOAD_CONCURRENCY", "4"))
+MAGNIT_UPLOAD_RETRIES = int(os.getenv("MAGNIT_UPLOAD_RETRIES", "2"))
+
+# Дельта-синхронизация: снимок последних отправленных значений
+SYNC_STATE_PATH = os.getenv("SYNC_STATE_PATH", os.path.join(tempfile.gettempdir(), "fbs_sync_state.sqlite3"))
+FULL_SYNC_INTERVAL_HOURS = float(os.getenv("FULL_SYNC_INTERVAL_HOURS", "24"))
+
+# Автосинхронизация: интервалы в минутах (0 - выключена, по умолчанию), случайный сдвиг запуска в секундах.
+# В режиме polling запускается JobQueue, на Vercel — cron, вызывающий /api/cron
+AUTO_SYNC_STOCKS_MINUTES = float(os.getenv("AUTO_SYNC_STOCKS_MINUTES", "0"))
+AUTO_SYNC_PRICES_MINUTES = float(os.getenv("AUTO_SYNC_PRICES_MINUTES", "0"))
+AUTO_SYNC_JITTER_SECONDS = float(os.getenv("AUTO_SYNC_JITTER_SECONDS", "60"))
+# Сколько секунд держится блокировка синхронизации в KV, если инстанс не снял её сам
+AUTO_SYNC_LOCK_TTL = float(os.getenv("AUTO_SYNC_LOCK_TTL", "900"))
+# Секрет, который Vercel Cron передаёт в заголовке Authorization
+CRON_SECRET = os.getenv("CRON_SECRET", "")
+
+# Время жизни кэша каталога товаров, секунд
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "300"))
+
+# Подписи товаров в заказах: SKU в одном запросе к списку товаров и размер кэша SKU -> товар
+SKU_LOOKUP_BATCH_SIZE = int(os.getenv("SKU_LOOKUP_BATCH_SIZE", "100"))
+SKU_LOOKUP_CACHE_SIZE = int(os.getenv("SKU_LOOKUP_CACHE_SIZE", "20000"))
+
+# Сколько заказов показывать на экране заказов (0 - все)
+ORDERS_VIEW_LIMIT = int(os.getenv("ORDERS_VIEW_LIMIT", "0"))
+
+# Параллельная обработка обновлений: сколько обрабатывается одновременно (обновления
+# одного чата — всегда по очереди) и сколько может ждать обработки
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "8"))
+UPDATE_MAX_PENDING = int(os.getenv("UPDATE_MAX_PENDING", "256"))
+
+# Webhook: отвечать Telegram сразу, обрабатывая обновления в фоновой очереди
+WEBHOOK_FAST_ACK = os.getenv("WEBHOOK_FAST_ACK", "0").lower() in ("1", "true", "yes")
+
+# Ограничение частоты запросов (запросов в секунду и размер всплеска) по хостам
+MAGNIT_RATE_LIMIT = float(os.getenv("MAGNIT_RATE_LIMIT", "5"))
+MAGNIT_RATE_BURST = float(os.getenv("MAGNIT_RATE_BURST", "10"))
+OZON_RATE_LIMIT = float(os.getenv("OZON_RATE_LIMIT", "10"))
+OZON_RATE_BURST = float(os.getenv("OZON_RATE_BURST", "10"))
+
+# Повторы запросов: число попыток для чтения и записи, задержки в секундах
+HTTP_READ_ATTEMPTS = int(os.getenv("HTTP_READ_ATTEMPTS", "4"))
+HTTP_WRITE_ATTEMPTS = int(os.getenv("HTTP_WRITE_ATTEMPTS", "3"))
+HTTP_RETRY_BASE_DELAY = float(os.getenv("HTTP_RETRY_BASE_DELAY", "0.5"))
+HTTP_RETRY_MAX_DELAY = float(os.getenv("HTTP_RETRY_MAX_DELAY", "10"))
+# Таймаут чтения для экранов просмотра, секунд: одна попытка, без повторов
+SCREEN_READ_TIMEOUT = float(os.getenv("SCREEN_READ_TIMEOUT", "5"))
+
+# Автомат для экранов просмотра: ошибок подряд до размыкания и пауза до пробного запроса, секунд
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+# Сколько товаров на одной странице инлайн-выбора
+PICKER_PAGE_SIZE = int(os.getenv("PICKER_PAGE_SIZE", "8"))
+
+# Исходящие сообщения Telegram: сообщений в секунду на чат (и всплеск) и на бота в целом
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_CHAT_BURST = float(os.getenv("TELEGRAM_CHAT_BURST", "3"))
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "25"))
+# Отчёт длиннее стольких сообщений отправляется файлом
+REPORT_DOCUMENT_PARTS = int(os.getenv("REPORT_DOCUMENT_PARTS", "5"))
+
+# Хранилище шага диалога и выбранного товара: kv (Vercel KV / Upstash), sqlite, memory или none.
+# На Vercel нужен kv: память и /tmp у каждого инстанса свои
+KV_REST_API_URL = os.getenv("KV_REST_API_URL", "")
+KV_REST_API_TOKEN = os.getenv("KV_REST_API_TOKEN", "")
+STATE_BACKEND = os.getenv("STATE_BACKEND", "kv" if KV_REST_API_URL else "sqlite").lower()
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", os.path.join(tempfile.gettempdir(), "fbs_state.sqlite3"))
+STATE_TTL_HOURS = float(os.getenv("STATE_TTL_HOURS", "24"))
+
+# Порт HTTP-сервера метрик в режиме polling (0 - не запускать)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# Токен для метрик (Authorization: Bearer ...); без него /api/metrics и METRICS_PORT открыты всем
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
 
 HEADERS = {
     "X-Api-Key": MAGNIT_API_KEY,
@@ -1,17 +1,18 @@
-from .orders import show_orders
-from .stocks import (
-    show_stocks_menu, sync_stocks, start_stock_edit,
-    handle_stock_product_selection, handle_stock_value_input
-)
-from .prices import (
-    show_prices_menu, sync_prices, start_price_edit,
-    handle_price_product_selection, handle_price_value_input
-)
+import importlib
 
-__all__ = [
-    'show_orders',
-    'show_stocks_menu', 'sync_stocks', 'start_stock_edit',
-    'handle_stock_product_selection', 'handle_stock_value_input',
-    'show_prices_menu', 'sync_prices', 'start_price_edit',
-    'handle_price_product_selection', 'handle_price_value_input'
-]
\ No newline at end of file
+# Модули обработчиков загружаются при первом обращении к имени, а не при импорте пакета
+_EXPORTS = {
+    'show_orders': 'orders',
+    'show_stocks_menu': 'stocks', 'sync_stocks': 'stocks', 'start_stock_edit': 'stocks',
+    'handle_stock_product_selection': 'stocks', 'handle_stock_value_input': 'stocks',
+    'show_prices_menu': 'prices', 'sync_prices': 'prices', 'start_price_edit': 'prices',
+    'handle_price_product_selection': 'prices', 'handle_price_value_input': 'prices',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
@@ -1,50 +1,98 @@
 from telegram import Update
 from telegram.ext import ContextTypes
-from magnit_api import get_unprocessed_orders, get_all_products
+from circuit_breaker import CircuitOpenError
+from magnit_api import ApiError, iter_unprocessed_order_pages, lookup_products, get_stale_orders, stale_notice
+from config import ORDERS_VIEW_LIMIT
+from messaging import reply, reply_report
+from metrics import observe_handler
 
 
-async def show_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показывает новые заказы"""
-    await update.message.reply_text("📦 Получаю информацию о заказах...")
+def format_order(order, catalog):
+    """Формирует текст одного заказа"""
+    order_id = order.get('order_id', 'N/A')
+    status = order.get('status', 'N/A')
+    items = order.get('items', [])
 
-    try:
-        orders = get_unprocessed_orders()
-        products = get_all_products()
+    lines = [
+        f"🆔 Заказ: {order_id}",
+        f"📊 Статус: {status}",
+        f"📦 Товаров: {len(items)}",
+    ]
+
+    for j, item in enumerate(items, 1):
+        sku_id = str(item.get('sku_id', 'N/A'))
+        quantity = item.get('quantity', 0)
+        row = catalog.row(sku_id)
+        seller_sku_id = catalog.seller_skus[row] if row is not None else 'N/A'
+        title = catalog.titles[row] if row is not None else f'Товар {sku_id}'
+
+        connector = "└─" if j == len(items) else "├─"
+        lines.append(f"  {connector} {seller_sku_id}: {title} - {quantity} шт")
+
+    lines.append("")
+    lines.append("─" * 40)
+    return "\n".join(lines) + "\n\n"
 
-        if not orders:
-            await update.message.reply_text("✅ Нет необработанных заказов")
-            return
 
-        message = f"📦 НЕОБРАБОТАННЫЕ ЗАКАЗЫ ({len(orders)}):\n\n"
+def order_sku_ids(orders):
+    """Различные sku_id товаров в заказах"""
+    return {item.get('sku_id') for order in orders for item in order.get('items', [])}
 
-        for i, order in enumerate(orders, 1):
-            order_id = order.get('order_id', 'N/A')
-            status = order.get('status', 'N/A')
-            items = order.get('items', [])
 
-            message += f"🆔 Заказ: {order_id}\n"
-            message += f"📊 Статус: {status}\n"
-            message += f"📦 Товаров: {len(items)}\n"
+@observe_handler
+async def show_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показывает новые заказы, отправляя их по мере загрузки страниц.
+
+    Команда /orders STATUS... показывает только заказы с указанными статусами,
+    /orders file присылает весь список одним файлом.
+    """
+    await reply(update.message, "📦 Получаю информацию о заказах...")
+
+    args = list(context.args or [])
+    as_file = "file" in args
+    statuses = {arg for arg in args if arg != "file"} or None
+    max_orders = ORDERS_VIEW_LIMIT or None
 
-            for j, item in enumerate(items, 1):
-                sku_id = str(item.get('sku_id', 'N/A'))
-                quantity = item.get('quantity', 0)
-                product_info = products.get(sku_id, {})
-                seller_sku_id = product_info.get('seller_sku_id', 'N/A')
-                title = product_info.get('title', f'Товар {sku_id}')
+    try:
+        report = []
+        total = 0
+
+        async def send_page(orders, header):
+            # Подписи только для товаров этих заказов, а не весь каталог
+            catalog = await lookup_products(order_sku_ids(orders))
+            text = (header if not total else "") + "".join(format_order(order, catalog) for order in orders)
+            if as_file:
+                report.append(text)
+            else:
+                # Отправляем страницу сразу, не дожидаясь следующих
+                await reply(update.message, text)
 
-                connector = "└─" if j == len(items) else "├─"
-                message += f"  {connector} {seller_sku_id}: {title} - {quantity} шт\n"
+        try:
+            async for page in iter_unprocessed_order_pages(statuses, max_orders):
+                await send_page(page, "📦 НЕОБРАБОТАННЫЕ ЗАКАЗЫ:\n\n")
+                total += len(page)
+        except (ApiError, CircuitOpenError):
+            # Если Magnit недоступен с самого начала, показываем последний удачный список
+            stale_orders = None if total else get_stale_orders(statuses, max_orders)
+            if stale_orders is None:
+                raise
+            if stale_orders:
+                header = stale_notice("orders") + "📦 НЕОБРАБОТАННЫЕ ЗАКАЗЫ:\n\n"
+                await send_page(stale_orders, header)
+            total = len(stale_orders)
 
-            message += "\n" + "─" * 40 + "\n\n"
+        if not total:
+            await reply(update.message, "✅ Нет необработанных заказов")
+            return
 
-        # Разбиваем сообщение если оно слишком длинное
-        if len(message) > 4096:
-            parts = [message[i:i + 4096] for i in range(0, len(message), 4096)]
-            for part in parts:
-                await update.message.reply_text(part)
-        else:
-            await update.message.reply_text(message)
+        footer = f"📦 Всего необработанных заказов: {total}"
+        if max_orders and total >= max_orders:
+            footer += f" (показаны первые {max_orders})"
+        if as_file:
+            await reply_report(update.message, "".join(report), filename="orders.txt")
+        await reply(update.message, footer)
 
+    except (ApiError, CircuitOpenError):
+        await reply(update.message, "❌ Ошибка при получении заказов: API недоступно")
     except Exception as e:
-        await update.message.reply_text(f"❌ Ошибка при получении заказов: {str(e)}")
\ No newline at end of file
+        await reply(update.message, f"❌ Ошибка при получении заказов: {str(e)}")
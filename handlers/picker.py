@@ -0,0 +1,137 @@
+from telegram import Update
+from telegram.ext import ContextTypes
+from magnit_api import get_all_products
+from keyboards import get_picker_keyboard
+from messaging import reply, edit
+from metrics import observe_handler
+from config import PICKER_PAGE_SIZE
+
+# Лимит Telegram на callback_data, байт
+CALLBACK_DATA_LIMIT = 64
+
+# Код вида выбора в callback_data -> (состояние после выбора, текст запроса значения)
+PICKER_KINDS = {
+    "s": (
+        "waiting_stock_value",
+        "✏️ Редактирование: {seller_sku}\n📝 Название: {title}\n\nВведите новый остаток:",
+    ),
+    "p": (
+        "waiting_price_value",
+        "✏️ Редактирование цены: {seller_sku}\n📝 Название: {title}\n\nВведите новую цену (руб):",
+    ),
+}
+
+
+def _fit_query(prefix, query):
+    """Обрезает поисковый запрос, чтобы callback_data уложилась в лимит"""
+    budget = CALLBACK_DATA_LIMIT - len(prefix.encode("utf-8"))
+    encoded = query.encode("utf-8")[:budget]
+    return encoded.decode("utf-8", errors="ignore")
+
+
+def page_callback(kind, page, query=""):
+    prefix = f"pg:{kind}:{page}:"
+    return prefix + _fit_query(prefix, query)
+
+
+def pick_callback(kind, sku_id):
+    return f"pk:{kind}:{sku_id}"
+
+
+async def render_picker(kind, page=0, query=""):
+    """Текст и клавиатура одной страницы выбора товара.
+
+    Без запроса листается весь каталог, с запросом — результаты поиска.
+    """
+    catalog = await get_all_products()
+    rows = catalog.search(query) if query else range(len(catalog))
+    if not rows:
+        return None, None
+
+    pages = (len(rows) + PICKER_PAGE_SIZE - 1) // PICKER_PAGE_SIZE
+    page = max(0, min(page, pages - 1))
+    shown = rows[page * PICKER_PAGE_SIZE:(page + 1) * PICKER_PAGE_SIZE]
+
+    if query:
+        text = f"🔎 Найдено товаров: {len(rows)}"
+    else:
+        text = f"📦 Товаров в каталоге: {len(rows)}"
+    text += "\n\nВыберите товар или введите артикул либо слова из названия для поиска:"
+
+    buttons = [
+        (f"{catalog.seller_skus[row]} - {catalog.titles[row]}", pick_callback(kind, catalog.sku_ids[row]))
+        for row in shown
+    ]
+    prev_data = page_callback(kind, page - 1, query) if page > 0 else None
+    next_data = page_callback(kind, page + 1, query) if page + 1 < pages else None
+    keyboard = get_picker_keyboard(buttons, f"{page + 1}/{pages}", prev_data, next_data)
+    return text, keyboard
+
+
+async def show_picker(update: Update, kind, query=""):
+    """Отправляет первую страницу выбора товара"""
+    text, keyboard = await render_picker(kind, 0, query)
+    if text is None:
+        if query:
+            await reply(update.message, "❌ Ничего не найдено. Введите артикул или слова из названия:")
+        else:
+            await reply(update.message, "❌ Не удалось получить список товаров")
+        return False
+
+    await reply(update.message, text, reply_markup=keyboard)
+    return True
+
+
+def select_product(context: ContextTypes.DEFAULT_TYPE, kind, seller_sku, title):
+    """Запоминает выбранный товар и возвращает текст запроса нового значения"""
+    state, prompt = PICKER_KINDS[kind]
+    context.user_data['selected_product'] = seller_sku
+    context.user_data['state'] = state
+    return prompt.format(seller_sku=seller_sku, title=title)
+
+
+async def handle_product_query(update: Update, context: ContextTypes.DEFAULT_TYPE, kind):
+    """Поиск товара по введённому тексту: один результат выбирается сразу, иначе — выбор кнопками"""
+    query = update.message.text.strip()
+    catalog = await get_all_products()
+    found = catalog.search(query, limit=2)
+
+    if len(found) == 1:
+        row = found[0]
+        prompt = select_product(context, kind, catalog.seller_skus[row], catalog.titles[row])
+        await reply(update.message, prompt)
+        return
+
+    await show_picker(update, kind, query)
+
+
+@observe_handler
+async def handle_picker_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обрабатывает нажатия кнопок выбора товара, редактируя то же сообщение"""
+    query = update.callback_query
+    action, kind, *rest = query.data.split(":", 3)
+
+    if kind not in PICKER_KINDS:
+        await query.answer()
+        return
+
+    if action == "pg":
+        page, search = int(rest[0]), rest[1] if len(rest) > 1 else ""
+        text, keyboard = await render_picker(kind, page, search)
+        await query.answer()
+        if text is not None:
+            await edit(query, text, reply_markup=keyboard)
+        return
+
+    if action == "pk":
+        catalog = await get_all_products()
+        row = catalog.row(rest[0])
+        if row is None:
+            await query.answer("❌ Товар не найден", show_alert=True)
+            return
+        await query.answer()
+        prompt = select_product(context, kind, catalog.seller_skus[row], catalog.titles[row])
+        await edit(query, prompt)
+        return
+
+    await query.answer()
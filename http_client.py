@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import httpx
+
+from metrics import API_REQUEST_RETRIES
+from config import (
+    HTTP_TIMEOUT, HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS, HTTP_KEEPALIVE_EXPIRY,
+    OZON_API_BASE_URL, MAGNIT_RATE_LIMIT, MAGNIT_RATE_BURST, OZON_RATE_LIMIT, OZON_RATE_BURST,
+    HTTP_READ_ATTEMPTS, HTTP_WRITE_ATTEMPTS, HTTP_RETRY_BASE_DELAY, HTTP_RETRY_MAX_DELAY, SCREEN_READ_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+# Один AsyncClient на хост (b2b-api.magnit.ru, api-seller.ozon.ru):
+# keep-alive соединения переиспользуются, TLS-рукопожатие не повторяется
+_clients = {}
+_clients_loop = None
+
+
+def get_client(url):
+    """Возвращает пул соединений для хоста из url"""
+    global _clients_loop
+
+    loop = asyncio.get_running_loop()
+    if _clients_loop is not loop:
+        # Соединения привязаны к event loop, в котором были открыты
+        _clients.clear()
+        _clients_loop = loop
+
+    host = urlsplit(url).netloc
+    client = _clients.get(host)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+        _clients[host] = client
+    return client
+
+
+async def close_clients():
+    """Закрывает все открытые пулы соединений"""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+class TokenBucket:
+    """Ограничитель частоты запросов к одному хосту.
+
+    Токен, которого ещё нет, резервируется заранее (счётчик уходит в минус),
+    поэтому одновременные запросы выстраиваются в очередь без блокировок.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    async def acquire(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+
+        wait = max(0.0, -self._tokens / self.rate, self._paused_until - now)
+        if wait:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds):
+        """Приостанавливает все запросы к хосту (например, по Retry-After)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+_buckets = {}
+
+
+def get_bucket(url):
+    """Возвращает ограничитель частоты для хоста из url"""
+    host = urlsplit(url).netloc
+    bucket = _buckets.get(host)
+    if bucket is None:
+        if host == urlsplit(OZON_API_BASE_URL).netloc:
+            bucket = TokenBucket(OZON_RATE_LIMIT, OZON_RATE_BURST)
+        else:
+            bucket = TokenBucket(MAGNIT_RATE_LIMIT, MAGNIT_RATE_BURST)
+        _buckets[host] = bucket
+    return bucket
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Когда и сколько раз повторять запрос"""
+    attempts: int
+    retry_statuses: frozenset
+    # Повторять ли при таймауте чтения, когда запрос мог уже выполниться
+    retry_read_errors: bool = True
+    base_delay: float = HTTP_RETRY_BASE_DELAY
+    max_delay: float = HTTP_RETRY_MAX_DELAY
+    # Таймаут одной попытки, секунд (None - HTTP_TIMEOUT клиента)
+    timeout: float = None
+
+    def backoff(self, attempt):
+        """Экспоненциальная задержка с jitter перед повтором номер attempt"""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def should_retry_error(self, error):
+        if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+            return True
+        return self.retry_read_errors and isinstance(error, httpx.TransportError)
+
+
+# Чтение можно повторять при любом сбое
+READ_POLICY = RetryPolicy(
+    attempts=HTTP_READ_ATTEMPTS,
+    retry_statuses=frozenset({429, 500, 502, 503, 504}),
+)
+
+# Экраны просмотра: одна короткая попытка, при сбое показываются последние удачные данные,
+# а долгие повторы делает фоновый пробный запрос с READ_POLICY
+SCREEN_READ_POLICY = RetryPolicy(
+    attempts=1,
+    retry_statuses=frozenset(),
+    timeout=SCREEN_READ_TIMEOUT,
+)
+
+# Запись повторяем, только если сервер точно её не принял
+WRITE_POLICY = RetryPolicy(
+    attempts=HTTP_WRITE_ATTEMPTS,
+    retry_statuses=frozenset({429, 502, 503, 504}),
+    retry_read_errors=False,
+)
+
+
+def _retry_after(response, max_delay):
+    """Задержка из заголовка Retry-After (секунды или HTTP-дата)"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), max_delay)
+
+
+async def post(url, payload, headers, policy=READ_POLICY):
+    """POST через пул хоста с ограничением частоты и повторами по policy.
+
+    Возвращает последний ответ (в том числе неуспешный) или
+    пробрасывает ошибку транспорта, если попытки закончились.
+    """
+    return await _send(url, payload, headers, policy, stream=False)
+
+
+@asynccontextmanager
+async def post_stream(url, payload, headers, policy=READ_POLICY):
+    """Как post, но тело ответа не читается заранее: его отдаёт response.aiter_bytes().
+
+    Повторы возможны только до начала чтения тела.
+    """
+    response = await _send(url, payload, headers, policy, stream=True)
+    try:
+        yield response
+    finally:
+        await response.aclose()
+
+
+async def _send(url, payload, headers, policy, stream):
+    client = get_client(url)
+    bucket = get_bucket(url)
+
+    for attempt in range(1, policy.attempts + 1):
+        await bucket.acquire()
+        try:
+            timeout = policy.timeout if policy.timeout is not None else httpx.USE_CLIENT_DEFAULT
+            request = client.build_request("POST", url, json=payload, headers=headers, timeout=timeout)
+            response = await client.send(request, stream=stream)
+        except httpx.TransportError as error:
+            if attempt == policy.attempts or not policy.should_retry_error(error):
+                raise
+            delay = policy.backoff(attempt)
+            reason = type(error).__name__
+        else:
+            if response.status_code not in policy.retry_statuses or attempt == policy.attempts:
+                return response
+            if stream:
+                await response.aclose()
+            retry_after = _retry_after(response, max(policy.max_delay, 60.0))
+            delay = retry_after if retry_after is not None else policy.backoff(attempt)
+            if response.status_code == 429:
+                bucket.pause(delay)
+            reason = response.status_code
+
+        API_REQUEST_RETRIES.inc(endpoint=urlsplit(url).path, reason=reason)
+        logger.warning(f"⏳ {urlsplit(url).path}: {reason}, повтор {attempt}/{policy.attempts - 1} через {delay:.1f} с")
+        await asyncio.sleep(delay)
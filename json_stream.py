@@ -0,0 +1,191 @@
+import codecs
+import json
+import re
+
+_WHITESPACE = " \t\n\r"
+# Сколько уже разобранного текста держать в буфере, прежде чем отрезать его
+_COMPACT_AT = 1 << 16
+# Символы, которыми может продолжиться число ("1" из "1.5", "1e" из "1e10")
+_NUMBER_TAIL = re.compile(r"[0-9.eE+-]*")
+
+
+class JsonArrayStream:
+    """Инкрементальный разбор объекта JSON с одним большим массивом.
+
+    Элементы массива под ключом key верхнего уровня отдаются по одному по мере
+    поступления байтов, остальные поля объекта (cursor, total и т.п.)
+    собираются в fields. В памяти держится только ещё не разобранный хвост
+    ответа, а не весь ответ и не всё дерево объектов.
+
+    Каждый элемент целиком разбирается json.JSONDecoder.raw_decode, поэтому
+    сам разбор идёт со скоростью модуля json.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.fields = {}
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+        # start -> key -> colon -> value -> comma_or_end; item / item_sep внутри массива
+        self._state = "start"
+        self._current_key = None
+        self.done = False
+
+    def feed(self, data):
+        """Добавляет байты ответа и возвращает элементы, которые удалось разобрать"""
+        self._buffer += self._utf8.decode(data)
+        return self._parse()
+
+    def close(self):
+        """Завершает разбор; бросает ValueError, если ответ оборван"""
+        self._buffer += self._utf8.decode(b"", final=True)
+        self._eof = True
+        items = self._parse()
+        if not self.done:
+            raise ValueError("Неполный JSON в ответе")
+        return items
+
+    def _skip_whitespace(self):
+        buffer, pos = self._buffer, self._pos
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+        self._pos = pos
+        return buffer[pos] if pos < len(buffer) else None
+
+    def _decode_value(self):
+        """Разбирает значение с текущей позиции или возвращает (False, None), если данных мало"""
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError:
+            if self._eof:
+                raise
+            return False, None
+        # Число может продолжиться в следующей порции: raw_decode берёт "1" из "1." или "1e"
+        if not self._eof:
+            if end == len(self._buffer):
+                return False, None
+            if (isinstance(value, (int, float)) and not isinstance(value, bool)
+                    and _NUMBER_TAIL.match(self._buffer, end).end() == len(self._buffer)):
+                return False, None
+        self._pos = end
+        return True, value
+
+    def _expect(self, char):
+        found = self._skip_whitespace()
+        if found is None:
+            return False
+        if found != char:
+            raise ValueError(f"Ожидался '{char}' в позиции {self._pos}, получен '{found}'")
+        self._pos += 1
+        return True
+
+    def _parse(self):
+        items = []
+        while not self.done:
+            if not self._step(items):
+                break
+        if self._pos > _COMPACT_AT:
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+        return items
+
+    def _step(self, items):
+        """Один шаг разбора; False, если нужно больше данных"""
+        state = self._state
+
+        if state == "start":
+            if not self._expect("{"):
+                return False
+            self._state = "key"
+            return True
+
+        if state == "key":
+            char = self._skip_whitespace()
+            if char is None:
+                return False
+            if char == "}":
+                self._pos += 1
+                self.done = True
+                return True
+            ok, key = self._decode_value()
+            if not ok:
+                return False
+            self._current_key = key
+            self._state = "colon"
+            return True
+
+        if state == "colon":
+            if not self._expect(":"):
+                return False
+            self._state = "value"
+            return True
+
+        if state == "value":
+            char = self._skip_whitespace()
+            if char is None:
+                return False
+            if self._current_key == self.key and char == "[":
+                self._pos += 1
+                self._state = "item"
+                self.fields[self.key] = []
+                return True
+            ok, value = self._decode_value()
+            if not ok:
+                return False
+            self.fields[self._current_key] = value
+            self._state = "comma_or_end"
+            return True
+
+        if state == "comma_or_end":
+            char = self._skip_whitespace()
+            if char is None:
+                return False
+            self._pos += 1
+            if char == ",":
+                self._state = "key"
+            elif char == "}":
+                self.done = True
+            else:
+                raise ValueError(f"Ожидался ',' или '}}' в позиции {self._pos - 1}")
+            return True
+
+        if state in ("item", "item_sep"):
+            char = self._skip_whitespace()
+            if char is None:
+                return False
+            if char == "]":
+                self._pos += 1
+                self._state = "comma_or_end"
+                return True
+            if state == "item_sep":
+                if char != ",":
+                    raise ValueError(f"Ожидался ',' или ']' в позиции {self._pos}")
+                self._pos += 1
+                self._state = "item"
+                return True
+            ok, item = self._decode_value()
+            if not ok:
+                return False
+            items.append(item)
+            self._state = "item_sep"
+            return True
+
+        raise AssertionError(state)
+
+
+async def iter_json_array(chunks, key, fields=None):
+    """Отдаёт элементы массива key из потока байтов JSON-объекта.
+
+    fields, если передан, после разбора содержит остальные поля объекта.
+    """
+    stream = JsonArrayStream(key)
+    if fields is not None:
+        stream.fields = fields
+    async for chunk in chunks:
+        for item in stream.feed(chunk):
+            yield item
+    for item in stream.close():
+        yield item
@@ -1,4 +1,4 @@
-from telegram import ReplyKeyboardMarkup, KeyboardButton
+from telegram import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 
 def get_main_keyboard():
     """Основная клавиатура"""
@@ -37,4 +37,19 @@ def get_prices_keyboard():
 def get_back_keyboard():
     """Клавиатура с кнопкой Назад"""
     keyboard = [[KeyboardButton("⬅️ Назад")]]
-    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
\ No newline at end of file
+    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+
+def get_picker_keyboard(products, page_label, prev_data=None, next_data=None):
+    """Инлайн-клавиатура выбора товара: товары по одному в строке и навигация по страницам"""
+    keyboard = [
+        [InlineKeyboardButton(label[:60], callback_data=data)]
+        for label, data in products
+    ]
+    navigation = []
+    if prev_data:
+        navigation.append(InlineKeyboardButton("◀️", callback_data=prev_data))
+    navigation.append(InlineKeyboardButton(page_label, callback_data="nop:-"))
+    if next_data:
+        navigation.append(InlineKeyboardButton("▶️", callback_data=next_data))
+    keyboard.append(navigation)
+    return InlineKeyboardMarkup(keyboard)
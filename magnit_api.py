@@ -1,12 +1,47 @@
-import requests
+import asyncio
+import contextlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+import httpx
+
 from config import *
+from http_client import post, post_stream, READ_POLICY, SCREEN_READ_POLICY, WRITE_POLICY
+from json_stream import iter_json_array
+from circuit_breaker import CircuitBreaker, CircuitOpenError, GuardedRead
+from single_flight import SingleFlight
+from catalog import Catalog, CatalogColumns
+from sync_state import get_sync_state
+from metrics import REGISTRY, API_REQUEST_SECONDS, API_REQUEST_ERRORS, API_REQUEST_RETRIES, SYNC_SECONDS, SYNC_SKUS, SYNC_RUNS
+
+# Максимальный размер страницы в /v4/product/info/stocks и /v5/product/info/prices
+OZON_PAGE_LIMIT = 1000
+# Размер страницы списка необработанных заказов Magnit
+ORDERS_PAGE_LIMIT = 100
+
+
+class ApiError(Exception):
+    """Ошибка обращения к API маркетплейса"""
+
+
+# Одинаковые одновременные синхронизации и чтения выполняются один раз
+_flights = SingleFlight()
 
 
-def api_request(url, payload, operation_name):
-    """Универсальная функция для API запросов"""
+async def api_request(url, payload, operation_name, policy=READ_POLICY, operation=None):
+    """Универсальная функция для API запросов.
+
+    Временные ошибки (429, 5xx, сбои соединения) повторяются по policy:
+    READ_POLICY для чтения, WRITE_POLICY для отправки данных.
+    operation — имя для метрик, если operation_name содержит переменные части.
+    """
+    endpoint = urlsplit(url).path
     try:
-        headers = HEADERS if 'magnit' in url else HEADERS_OZON
-        response = requests.post(url, json=payload, headers=headers, timeout=30)
+        headers = HEADERS_OZON if url.startswith(OZON_API_BASE_URL) else HEADERS
+        with API_REQUEST_SECONDS.time(endpoint=endpoint, operation=operation or operation_name):
+            response = await post(url, payload, headers, policy)
 
         if 200 <= response.status_code < 300:
             try:
@@ -14,117 +49,861 @@ def api_request(url, payload, operation_name):
             except Exception:
                 return {"status": "success"}
         else:
+            API_REQUEST_ERRORS.inc(endpoint=endpoint, status=response.status_code)
             print(f"❌ {operation_name}: {response.status_code}")
             return None
     except Exception as e:
+        API_REQUEST_ERRORS.inc(endpoint=endpoint, status="error")
         print(f"❌ Ошибка {operation_name}: {e}")
         return None
 
 
-def get_unprocessed_orders():
+async def api_stream(url, payload, operation_name, key, fields=None, policy=READ_POLICY):
+    """Запрос с потоковым разбором ответа: элементы массива key отдаются по мере загрузки.
+
+    Весь ответ и всё дерево объектов в памяти не собираются. Остальные поля
+    ответа попадают в fields. Если ответ оборвался на середине, тот же запрос
+    повторяется по policy, а уже отданные элементы пропускаются. Любая
+    ошибка, в том числе оборванный ответ, пробрасывается как ApiError.
+    """
+    endpoint = urlsplit(url).path
+    headers = HEADERS_OZON if url.startswith(OZON_API_BASE_URL) else HEADERS
+    yielded = 0
+    attempt = 1
+    while True:
+        started = time.monotonic()
+        timed = False
+        skip = yielded
+        try:
+            async with post_stream(url, payload, headers, policy) as response:
+                # Время ответа API — до заголовков: тело читается вместе с обработкой элементов
+                API_REQUEST_SECONDS.observe(time.monotonic() - started, endpoint=endpoint, operation=operation_name)
+                timed = True
+                if not 200 <= response.status_code < 300:
+                    API_REQUEST_ERRORS.inc(endpoint=endpoint, status=response.status_code)
+                    print(f"❌ {operation_name}: {response.status_code}")
+                    raise ApiError(f"{operation_name}: {response.status_code}")
+                async for item in iter_json_array(response.aiter_bytes(), key, fields):
+                    if skip:
+                        skip -= 1
+                        continue
+                    yield item
+                    yielded += 1
+            return
+        except ApiError:
+            raise
+        except httpx.TransportError as e:
+            if timed and attempt < policy.attempts and policy.should_retry_error(e):
+                delay = policy.backoff(attempt)
+                API_REQUEST_RETRIES.inc(endpoint=endpoint, reason=type(e).__name__)
+                print(f"⏳ {operation_name}: ответ оборван ({type(e).__name__}), повтор через {delay:.1f} с")
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            error = e
+        except Exception as e:
+            error = e
+        finally:
+            if not timed:
+                API_REQUEST_SECONDS.observe(time.monotonic() - started, endpoint=endpoint, operation=operation_name)
+        API_REQUEST_ERRORS.inc(endpoint=endpoint, status="error")
+        print(f"❌ Ошибка {operation_name}: {error}")
+        raise ApiError(f"{operation_name}: {error}") from error
+
+
+# Чтения для экранов просмотра: при недоступности Magnit отдаются последние удачные данные
+_reads = {}
+
+
+def _guarded(name, fetch):
+    """fetch(policy): экран ждёт одну короткую попытку, фоновый пробный запрос — повторы READ_POLICY"""
+    read = GuardedRead(
+        name, lambda: fetch(SCREEN_READ_POLICY), CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT,
+        revalidate=lambda: fetch(READ_POLICY),
+    )
+    _reads[name] = read
+    return read
+
+
+def stale_notice(*names):
+    """Предупреждение для экрана, если какие-то из данных устарели, иначе пустая строка"""
+    stamps = [read.stale_since() for name, read in _reads.items() if name in names]
+    stamps = [stamp for stamp in stamps if stamp]
+    if not stamps:
+        return ""
+    as_of = time.strftime('%d.%m %H:%M:%S', time.localtime(min(stamps)))
+    return f"⚠️ Magnit недоступен, данные по состоянию на {as_of}\n\n"
+
+
+async def _walk_order_pages(policy=READ_POLICY):
+    """Обходит все страницы необработанных заказов по offset, запрашивая следующую заранее"""
+    def request_page(offset):
+        payload = {"limit": ORDERS_PAGE_LIMIT, "offset": offset}
+        return asyncio.create_task(api_request(ORDERS_LIST_URL, payload, "Получение заказов", policy))
+
+    offset = 0
+    next_page = request_page(offset)
+    try:
+        while next_page is not None:
+            data = await next_page
+            next_page = None
+            if data is None:
+                raise ApiError("Получение заказов: не удалось загрузить страницу")
+
+            orders = data.get('orders', [])
+            offset += len(orders)
+            if len(orders) >= ORDERS_PAGE_LIMIT:
+                next_page = request_page(offset)
+            yield orders
+    finally:
+        if next_page is not None:
+            next_page.cancel()
+
+
+async def _fetch_all_orders(policy=READ_POLICY):
+    return [order async for page in _walk_order_pages(policy) for order in page]
+
+
+_orders_read = _guarded("orders", _fetch_all_orders)
+
+
+def _select_orders(orders, statuses, max_orders, already=0):
+    if statuses:
+        orders = [order for order in orders if order.get('status') in statuses]
+    if max_orders is not None:
+        orders = orders[:max_orders - already]
+    return orders
+
+
+async def iter_unprocessed_order_pages(statuses=None, max_orders=None):
+    """Обходит необработанные заказы по offset, отдавая страницы по мере загрузки.
+
+    statuses — оставить только заказы с этими статусами,
+    max_orders — остановиться, набрав столько заказов.
+    """
+    _orders_read.check()
+    walked = []
+    returned = 0
+    complete = True
+    try:
+        # aclosing: при выходе раньше времени обход закрывается и отменяет запрос следующей страницы
+        async with contextlib.aclosing(_walk_order_pages(SCREEN_READ_POLICY)) as pages:
+            async for page in pages:
+                walked.extend(page)
+                orders = _select_orders(page, statuses, max_orders, returned)
+                returned += len(orders)
+                if orders:
+                    yield orders
+                if max_orders is not None and returned >= max_orders:
+                    complete = False
+                    break
+    except ApiError:
+        _orders_read.failed()
+        raise
+    if complete:
+        _orders_read.succeeded(walked)
+    else:
+        # Неполный список не заменяет сохранённый полный
+        _orders_read.responded()
+
+
+def get_stale_orders(statuses=None, max_orders=None):
+    """Последний удачно полученный список заказов или None"""
+    orders = _orders_read.fallback(None)
+    if orders is None:
+        return None
+    return _select_orders(orders, statuses, max_orders)
+
+
+async def get_unprocessed_orders(statuses=None, max_orders=None):
     """Получает список необработанных заказов"""
-    payload = {"limit": 100, "offset": 0}
-    data = api_request(ORDERS_LIST_URL, payload, "Получение заказов")
-    return data.get('orders', []) if data else []
+    try:
+        return [
+            order
+            async for page in iter_unprocessed_order_pages(statuses, max_orders)
+            for order in page
+        ]
+    except (ApiError, CircuitOpenError):
+        return get_stale_orders(statuses, max_orders) or []
 
 
-def get_all_products():
-    """Получает все товары с названиями"""
-    payload = {"limit": 1000}
-    data = api_request(PRODUCTS_URL, payload, "Получение товаров")
-    if not data:
-        return {}
-
-    products = data.get('result', [])
-    product_mapping = {}
-    for product in products:
-        sku_id = str(product.get('sku_id'))
-        seller_sku_id = product.get('seller_sku_id', 'N/A')
-        title = product.get('title', 'N/A')
-        product_mapping[sku_id] = {
-            'seller_sku_id': seller_sku_id,
-            'title': title
+class CatalogCache:
+    """Кэш каталога товаров с TTL.
+
+    Одновременные промахи ждут одного и того же запроса к API,
+    неудачная загрузка в кэш не попадает.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.version = 0
+        self._catalog = None
+        self._loaded_at = 0
+        self._refresh = None
+
+    def is_fresh(self):
+        return self._catalog is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def peek(self):
+        """Свежий каталог без обращения к API или None"""
+        return self._catalog if self.is_fresh() else None
+
+    async def get(self, loader):
+        if self.is_fresh():
+            self.hits += 1
+            return self._catalog
+
+        self.misses += 1
+        if self._refresh is None:
+            self._refresh = asyncio.ensure_future(self._load(loader))
+        return await asyncio.shield(self._refresh)
+
+    async def _load(self, loader):
+        try:
+            catalog = await loader()
+            if catalog:
+                self._catalog = catalog
+                self._loaded_at = time.monotonic()
+                self.version += 1
+            return catalog
+        finally:
+            self._refresh = None
+
+    def invalidate(self):
+        self._catalog = None
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "version": self.version,
+            "size": len(self._catalog or ()),
+            "fresh": self.is_fresh(),
         }
-    return product_mapping
 
 
-def get_ozon_stocks():
-    """Получает остатки с Ozon"""
-    payload = {"filter": {"visibility": "ALL"}, "limit": 100}
-    data = api_request(OZON_STOCKS_URL, payload, "Получение остатков Ozon")
-    return data.get('items', []) if data else []
+_catalog_cache = CatalogCache(CATALOG_CACHE_TTL)
+
 
+async def get_all_products():
+    """Каталог всех товаров с названиями (из кэша, если он свежий)"""
+    try:
+        return await _catalog_cache.get(_products_read.fetch)
+    except (ApiError, CircuitOpenError):
+        return _products_read.fallback(Catalog())
 
-def get_ozon_prices():
-    """Получает цены с Ozon"""
-    payload = {"filter": {"visibility": "ALL"}, "limit": 100}
-    data = api_request(OZON_PRICES_URL, payload, "Получение цен Ozon")
-    return data.get('items', []) if data else []
 
+def invalidate_catalog():
+    """Сбрасывает кэш каталога, следующий запрос пойдёт в API"""
+    _catalog_cache.invalidate()
 
-def sync_stocks_with_magnit():
-    """Синхронизирует остатки с Magnit"""
-    stock_items = get_ozon_stocks()
-    if not stock_items:
-        return False, "Нет данных по остаткам с Ozon"
-
-    magnit_stocks = []
-    for item in stock_items:
-        offer_id = item.get('offer_id')
-        if not offer_id:
+
+def get_catalog_cache_stats():
+    """Счётчики попаданий и промахов кэша каталога"""
+    return _catalog_cache.stats()
+
+
+class SkuLookupCache:
+    """Товары по sku_id для подписи заказов: LRU на max_size товаров с TTL"""
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._items = OrderedDict()
+
+    def get(self, sku_id):
+        """(seller_sku_id, title) или None, если товара нет или запись устарела"""
+        entry = self._items.get(sku_id)
+        if entry is None or time.monotonic() - entry[0] >= self.ttl:
+            return None
+        self._items.move_to_end(sku_id)
+        return entry[1:]
+
+    def put(self, sku_id, seller_sku_id, title):
+        self._items[sku_id] = (time.monotonic(), seller_sku_id, title)
+        self._items.move_to_end(sku_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+
+_sku_cache = SkuLookupCache(CATALOG_CACHE_TTL, SKU_LOOKUP_CACHE_SIZE)
+
+
+async def _fetch_products_by_sku(sku_ids):
+    """Товары с указанными sku_id одним запросом к списку товаров"""
+    payload = {"filter": {"sku_ids": sku_ids}, "limit": len(sku_ids)}
+    return [
+        product
+        async for product in api_stream(
+            PRODUCTS_URL, payload, "Получение товаров по SKU", "result", policy=SCREEN_READ_POLICY
+        )
+    ]
+
+
+async def lookup_products(sku_ids):
+    """Каталог только из товаров sku_ids — для подписи заказов.
+
+    Товары берутся из кэша SKU и свежего полного каталога, недостающие
+    запрашиваются у Magnit с фильтром по sku_id пачками по
+    SKU_LOOKUP_BATCH_SIZE. Работа пропорциональна числу товаров в заказах,
+    а не размеру каталога. Если Magnit недоступен, используется последний
+    удачно загруженный каталог; ненайденных товаров в результате нет.
+    """
+    wanted = set()
+    for sku_id in sku_ids:
+        try:
+            wanted.add(int(sku_id))
+        except (TypeError, ValueError):
             continue
-        stocks = item.get('stocks', [])
-        present = sum(stock.get('present', 0) for stock in stocks)
-        magnit_stocks.append({
+
+    catalog = _catalog_cache.peek()
+    records, missing = [], []
+    for sku_id in wanted:
+        found = _sku_cache.get(sku_id) or _find_in_catalog(catalog, sku_id)
+        if found is None:
+            missing.append(sku_id)
+        else:
+            records.append((sku_id, *found))
+
+    if missing:
+        batches = [
+            missing[start:start + SKU_LOOKUP_BATCH_SIZE]
+            for start in range(0, len(missing), SKU_LOOKUP_BATCH_SIZE)
+        ]
+        results = await asyncio.gather(*(_fetch_products_by_sku(batch) for batch in batches), return_exceptions=True)
+        fetched = set()
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"⚠️ Не удалось получить товары по SKU: {result}")
+                continue
+            for product in result:
+                try:
+                    sku_id = int(product.get('sku_id'))
+                except (TypeError, ValueError):
+                    continue
+                # Лишние товары, если фильтр не сработал, в кэш не берём
+                if sku_id not in wanted or sku_id in fetched:
+                    continue
+                seller_sku_id, title = product.get('seller_sku_id', 'N/A'), product.get('title', 'N/A')
+                _sku_cache.put(sku_id, seller_sku_id, title)
+                records.append((sku_id, seller_sku_id, title))
+                fetched.add(sku_id)
+
+        stale = _products_read.fallback(None)
+        for sku_id in missing:
+            if sku_id not in fetched:
+                found = _find_in_catalog(stale, sku_id)
+                if found is not None:
+                    records.append((sku_id, *found))
+
+    return Catalog(records)
+
+
+def _find_in_catalog(catalog, sku_id):
+    """(seller_sku_id, title) товара из каталога или None"""
+    row = catalog.row(sku_id) if catalog is not None else None
+    if row is None:
+        return None
+    return catalog.seller_skus[row], catalog.titles[row]
+
+
+async def fetch_all_products(policy=READ_POLICY):
+    """Загружает все товары с названиями из API"""
+    payload = {"limit": 1000}
+    records = [
+        (int(product['sku_id']), product.get('seller_sku_id', 'N/A'), product.get('title', 'N/A'))
+        async for product in api_stream(PRODUCTS_URL, payload, "Получение товаров", "result", policy=policy)
+        if product.get('sku_id') is not None
+    ]
+    return Catalog(records)
+
+
+_products_read = _guarded("products", fetch_all_products)
+
+
+async def iter_ozon_items(url, operation_name):
+    """Обходит выдачу Ozon по cursor, отдавая товары по мере загрузки.
+
+    Страницы читаются потоком в фоновой задаче и разбираются по одному
+    товару. Очередь между загрузкой и обработкой ограничена одной страницей:
+    загрузка идёт параллельно с обработкой, а в памяти не больше страницы.
+    """
+    queue = asyncio.Queue(maxsize=OZON_PAGE_LIMIT)
+    end = object()
+
+    async def load_pages():
+        payload = {"filter": {"visibility": "ALL"}, "limit": OZON_PAGE_LIMIT, "cursor": ""}
+        try:
+            while True:
+                fields = {}
+                count = 0
+                async for item in api_stream(url, payload, operation_name, "items", fields):
+                    await queue.put(item)
+                    count += 1
+                cursor = fields.get('cursor')
+                if not cursor or count < OZON_PAGE_LIMIT:
+                    break
+                payload = dict(payload, cursor=cursor)
+        except ApiError as e:
+            await queue.put(e)
+        else:
+            await queue.put(end)
+
+    loader = asyncio.create_task(load_pages())
+    try:
+        while True:
+            item = await queue.get()
+            if item is end:
+                break
+            if isinstance(item, ApiError):
+                raise item
+            yield item
+    finally:
+        loader.cancel()
+
+
+def iter_ozon_stocks():
+    """Постранично получает остатки с Ozon"""
+    return iter_ozon_items(OZON_STOCKS_URL, "Получение остатков Ozon")
+
+
+def iter_ozon_prices():
+    """Постранично получает цены с Ozon"""
+    return iter_ozon_items(OZON_PRICES_URL, "Получение цен Ozon")
+
+
+async def get_ozon_stocks():
+    """Получает все остатки с Ozon"""
+    try:
+        return [item async for item in iter_ozon_stocks()]
+    except ApiError:
+        return []
+
+
+async def get_ozon_prices():
+    """Получает все цены с Ozon"""
+    try:
+        return [item async for item in iter_ozon_prices()]
+    except ApiError:
+        return []
+
+
+def _stock_warehouses(stock):
+    """Склады Magnit, в которые по WAREHOUSE_MAPPING попадает запись остатка Ozon"""
+    stock_type = str(stock.get('type', '')).lower()
+    ozon_warehouses = set(stock.get('warehouse_ids') or ())
+    for warehouse_id, rule in WAREHOUSE_MAPPING.items():
+        if rule["types"] and stock_type not in rule["types"]:
+            continue
+        if rule["ozon_warehouses"] and not ozon_warehouses & rule["ozon_warehouses"]:
+            continue
+        yield warehouse_id
+
+
+def stock_rows(item):
+    """Преобразует остаток Ozon в строки для Magnit — по одной на каждый склад Magnit"""
+    offer_id = item.get('offer_id')
+    if not offer_id:
+        return []
+    present = dict.fromkeys(WAREHOUSE_MAPPING, 0)
+    for stock in item.get('stocks', []):
+        for warehouse_id in _stock_warehouses(stock):
+            present[warehouse_id] += stock.get('present', 0)
+    return [
+        {
             "seller_sku_id": offer_id,
-            "stock": present,
-            "warehouse_id": WAREHOUSE_ID
-        })
+            "stock": stock,
+            "warehouse_id": warehouse_id
+        }
+        for warehouse_id, stock in present.items()
+    ]
+
+
+def price_row(item):
+    """Преобразует цену Ozon в строку для Magnit"""
+    offer_id = item.get('offer_id')
+    if not offer_id:
+        return None
+    price_info = item.get('price', {})
+    price = price_info.get('price')
+    if price is None:
+        return None
+    try:
+        if isinstance(price, str):
+            price_value = float(price.replace('₽', '').replace(' ', '').strip())
+        else:
+            price_value = float(price)
+    except (ValueError, TypeError):
+        return None
+    return {
+        "seller_sku_id": offer_id,
+        "price": price_value,
+        "currency_code": "RUB"
+    }
+
+
+@dataclass
+class SyncResult:
+    """Итог синхронизации: счётчики по частям и SKU, которые не удалось отправить"""
+    total: int = 0
+    sent: int = 0
+    chunks: int = 0
+    failed_chunks: int = 0
+    retried_chunks: int = 0
+    failed_skus: list = field(default_factory=list)
+    unchanged: int = 0
+    full: bool = False
+    # Склад Magnit -> итог по складу (для остатков; у цен склад пустой)
+    warehouses: dict = field(default_factory=dict)
+    duration: float = 0.0
+    error: str = None
+    message: str = ""
+
+    @property
+    def success(self):
+        has_data = self.total > 0 or self.unchanged > 0
+        return self.error is None and has_data and not self.failed_skus
+
+
+def _failed_skus_text(result, limit=10):
+    """Список неотправленных SKU для сообщения пользователю"""
+    text = ", ".join(result.failed_skus[:limit])
+    if len(result.failed_skus) > limit:
+        text += f" и еще {len(result.failed_skus) - limit}"
+    return text
+
+
+async def _transform(items, transform):
+    """Преобразует поток товаров Ozon в строки для Magnit, пропуская пустые.
+
+    transform возвращает строку, список строк или None.
+    """
+    async for item in items:
+        rows = transform(item)
+        if isinstance(rows, dict):
+            yield rows
+        elif rows:
+            for row in rows:
+                yield row
+
+
+async def _iterate(rows):
+    """Позволяет передавать в загрузчик как список, так и асинхронный поток"""
+    if hasattr(rows, '__aiter__'):
+        async for row in rows:
+            yield row
+    else:
+        for row in rows:
+            yield row
+
+
+async def upload_in_chunks(rows, url, key, operation_name,
+                           chunk_size=None, concurrency=None, retries=None,
+                           result=None, on_sent=None):
+    """Отправляет строки в Magnit частями с ограниченным параллелизмом.
+
+    Части формируются по мере поступления строк. Неудачные части
+    повторяются отдельными раундами, успешные повторно не отправляются.
+    on_sent(chunk) вызывается для каждой успешно отправленной части.
+    """
+    chunk_size = chunk_size or MAGNIT_UPLOAD_CHUNK_SIZE
+    concurrency = concurrency or MAGNIT_UPLOAD_CONCURRENCY
+    retries = MAGNIT_UPLOAD_RETRIES if retries is None else retries
+
+    result = result or SyncResult()
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = []
+    failed = []
+
+    async def send(chunk):
+        try:
+            response = await api_request(
+                url, {key: chunk}, f"{operation_name} ({len(chunk)} шт)", WRITE_POLICY, operation_name
+            )
+        finally:
+            semaphore.release()
+        if response:
+            result.sent += len(chunk)
+            if on_sent:
+                on_sent(chunk)
+        else:
+            failed.append(chunk)
+
+    async def dispatch(chunk):
+        # Ждём свободный слот до создания задачи, чтобы не копить части в памяти
+        await semaphore.acquire()
+        tasks.append(asyncio.create_task(send(chunk)))
+
+    try:
+        chunk = []
+        async for row in _iterate(rows):
+            chunk.append(row)
+            result.total += 1
+            if len(chunk) >= chunk_size:
+                result.chunks += 1
+                await dispatch(chunk)
+                chunk = []
+        if chunk:
+            result.chunks += 1
+            await dispatch(chunk)
+    except ApiError as e:
+        result.error = str(e)
+    finally:
+        await asyncio.gather(*tasks)
+
+    for _ in range(retries):
+        if not failed:
+            break
+        retry_chunks = list(failed)
+        failed.clear()
+        tasks.clear()
+        result.retried_chunks += len(retry_chunks)
+        for chunk in retry_chunks:
+            await dispatch(chunk)
+        await asyncio.gather(*tasks)
+
+    result.failed_chunks = len(failed)
+    result.failed_skus = [row["seller_sku_id"] for chunk in failed for row in chunk]
+    return result
+
+
+def _snapshot_entry(row):
+    """Ключ и значение строки для снимка синхронизации"""
+    if "stock" in row:
+        return row["seller_sku_id"], str(row["warehouse_id"]), str(row["stock"])
+    return row["seller_sku_id"], "", str(row["price"])
+
+
+_END_OF_ROWS = object()
+
+
+async def _drain(queue):
+    """Строки из очереди одного склада до признака конца; ошибка Ozon пробрасывается"""
+    while True:
+        row = await queue.get()
+        if row is _END_OF_ROWS:
+            return
+        if isinstance(row, ApiError):
+            raise row
+        yield row
+
+
+def _merge_results(result, parts):
+    """Складывает итоги складов в общий итог"""
+    result.warehouses = parts
+    for part in parts.values():
+        result.total += part.total
+        result.sent += part.sent
+        result.chunks += part.chunks
+        result.failed_chunks += part.failed_chunks
+        result.retried_chunks += part.retried_chunks
+        result.failed_skus.extend(part.failed_skus)
+        result.unchanged += part.unchanged
+        result.error = result.error or part.error
+
+
+async def _sync_changed(key, items, transform, url, operation_name, full):
+    """Отправляет в Magnit только строки, изменившиеся с прошлой синхронизации.
+
+    Раз в FULL_SYNC_INTERVAL_HOURS (или по запросу) отправляется весь каталог,
+    чтобы исправить расхождения со снимком.
+
+    Товары Ozon читаются один раз и раскладываются по складам Magnit
+    (warehouse_id строки); каждый склад отправляется своим потоком
+    параллельно с остальными. Очереди складов ограничены, поэтому чтение
+    Ozon не убегает вперёд отправки.
+    """
+    started = time.monotonic()
+    state = get_sync_state()
+    full = full or time.time() - state.last_full_sync(key) >= FULL_SYNC_INTERVAL_HOURS * 3600
+    snapshot = {} if full else state.load(key)
+    result = SyncResult(full=full)
+    parts = {}
+    queues = {}
+    uploads = []
+
+    def remember(chunk):
+        state.save(key, [_snapshot_entry(row) for row in chunk])
+
+    def open_warehouse(warehouse):
+        parts[warehouse] = SyncResult(full=full)
+        queues[warehouse] = asyncio.Queue(maxsize=MAGNIT_UPLOAD_CHUNK_SIZE)
+        name = f"{operation_name}, склад {warehouse}" if warehouse else operation_name
+        uploads.append(asyncio.create_task(upload_in_chunks(
+            _drain(queues[warehouse]), url, key, name, result=parts[warehouse], on_sent=remember
+        )))
+
+    error = None
+    try:
+        async for row in _transform(items, transform):
+            sku, warehouse, value = _snapshot_entry(row)
+            if warehouse not in parts:
+                open_warehouse(warehouse)
+            if snapshot.get((sku, warehouse)) == value:
+                parts[warehouse].unchanged += 1
+            else:
+                await queues[warehouse].put(row)
+    except ApiError as e:
+        error = e
+    finally:
+        for queue in queues.values():
+            await queue.put(error or _END_OF_ROWS)
+        await asyncio.gather(*uploads)
+
+    _merge_results(result, parts)
+    if error is not None:
+        result.error = str(error)
+
+    if full and result.success:
+        state.mark_full_sync(key)
+
+    SYNC_SECONDS.observe(time.monotonic() - started, kind=key, mode="full" if full else "delta")
+    SYNC_SKUS.inc(result.sent, kind=key, outcome="sent")
+    SYNC_SKUS.inc(result.unchanged, kind=key, outcome="unchanged")
+    SYNC_SKUS.inc(len(result.failed_skus), kind=key, outcome="failed")
+    SYNC_RUNS.inc(kind=key, status="ok" if result.success else "error")
+    return result
+
 
-    if not magnit_stocks:
-        return False, "Нет данных по остаткам для отправки"
+def _sync_summary(result, unit="товаров"):
+    """Пояснение к количеству отправленных строк; unit — что считается строкой"""
+    if result.full:
+        return f"полная синхронизация, {result.sent} {unit}"
+    return f"изменено {result.sent}, без изменений {result.unchanged} {unit}"
 
-    payload = {"stocks": magnit_stocks}
-    result = api_request(MAGNIT_STOCKS_URL, payload, "Отправка остатков")
-    return bool(result), "Остатки успешно синхронизированы" if result else "Ошибка синхронизации остатков"
 
+async def sync_stocks_with_magnit(full=False):
+    """Синхронизирует остатки с Magnit"""
+    result = await _sync_changed(
+        "stocks", iter_ozon_stocks(), stock_rows, MAGNIT_STOCKS_URL, "Отправка остатков", full
+    )
+    # С несколькими складами строка — товар на складе, и строк больше, чем товаров
+    unit = "позиций (товар × склад)" if len(result.warehouses) > 1 else "товаров"
+    if result.error:
+        result.message = "Не удалось получить остатки с Ozon"
+    elif not result.total and not result.unchanged:
+        result.message = "Нет данных по остаткам для отправки"
+    elif result.failed_skus:
+        result.message = (
+            f"Ошибка синхронизации остатков: отправлено {result.sent} из {result.total} {unit}\n"
+            f"Не отправлены: {_failed_skus_text(result)}"
+        )
+    elif not result.total:
+        result.message = f"Остатки не изменились ({result.unchanged} {unit})"
+    else:
+        result.message = f"Остатки успешно синхронизированы ({_sync_summary(result, unit)})"
+    if len(result.warehouses) > 1:
+        result.message += "".join(
+            f"\n🏬 Склад {warehouse}: {'❌' if part.error or part.failed_skus else '✅'} {_sync_summary(part)}"
+            + (f", не отправлено {len(part.failed_skus)}" if part.failed_skus else "")
+            for warehouse, part in result.warehouses.items()
+        )
+    return result
 
-def sync_prices_with_magnit():
+
+async def sync_prices_with_magnit(full=False):
     """Синхронизирует цены с Magnit"""
-    price_items = get_ozon_prices()
-    if not price_items:
-        return False, "Нет данных по ценам с Ozon"
-
-    magnit_prices = []
-    for item in price_items:
-        offer_id = item.get('offer_id')
-        if not offer_id:
-            continue
-        price_info = item.get('price', {})
-        price = price_info.get('price')
-        if price is not None:
-            try:
-                if isinstance(price, str):
-                    price_value = float(price.replace('₽', '').replace(' ', '').strip())
-                else:
-                    price_value = float(price)
-                magnit_prices.append({
-                    "seller_sku_id": offer_id,
-                    "price": price_value,
-                    "currency_code": "RUB"
-                })
-            except (ValueError, TypeError):
-                continue
+    result = await _sync_changed(
+        "prices", iter_ozon_prices(), price_row, MAGNIT_PRICES_URL, "Отправка цен в Magnit", full
+    )
+    if result.error:
+        result.message = "Не удалось получить цены с Ozon"
+    elif not result.total and not result.unchanged:
+        result.message = "Нет данных по ценам для отправки"
+    elif result.failed_skus:
+        result.message = (
+            f"Ошибка синхронизации цен: отправлено {result.sent} из {result.total}\n"
+            f"Не отправлены: {_failed_skus_text(result)}"
+        )
+    elif not result.total:
+        result.message = f"Цены не изменились ({result.unchanged} товаров)"
+    else:
+        result.message = f"Цены успешно синхронизированы ({_sync_summary(result)})"
+    return result
+
+
+async def _timed_sync(sync):
+    """Выполняет синхронизацию, замеряя время; исключение превращается в неуспешный результат"""
+    started = time.monotonic()
+    try:
+        result = await sync
+    except Exception as e:
+        print(f"❌ Ошибка синхронизации: {e}")
+        result = SyncResult(error=str(e), message=f"Ошибка синхронизации: {e}")
+    result.duration = time.monotonic() - started
+    return result
+
+
+_SYNCS = {
+    "stocks": sync_stocks_with_magnit,
+    "prices": sync_prices_with_magnit,
+}
+
+
+# Вид синхронизации -> True, если идущая сейчас синхронизация полная
+_sync_full = {}
+
+
+def _sync_key(kind):
+    return f"sync:{kind}"
+
+
+def _sync_factory(kind, full):
+    def factory():
+        _sync_full[kind] = full
+        return _timed_sync(_SYNCS[kind](full))
+    return factory
+
+
+async def _full_after_delta(kind):
+    """Дожидается идущей дельта-синхронизации kind и запускает полную (или присоединяется к полной)"""
+    while True:
+        run, joined = _flights.start(_sync_key(kind), _sync_factory(kind, True))
+        result = await run
+        if not joined or _sync_full[kind]:
+            return result
+
 
-    if not magnit_prices:
-        return False, "Нет данных по ценам для отправки"
+def start_sync(kind, full=False):
+    """Запускает синхронизацию kind ("stocks" или "prices") или присоединяется к уже идущей.
 
-    payload = {"prices": magnit_prices}
-    result = api_request(MAGNIT_PRICES_URL, payload, "Отправка цен в Magnit")
-    return bool(result), "Цены успешно синхронизированы" if result else "Ошибка синхронизации цен"
+    Одновременно идёт не больше одной синхронизации каждого вида: обе
+    отправляют одни и те же SKU и пишут один снимок. Дельта присоединяется
+    к любой идущей синхронизации; полная — только к полной, а если идёт
+    дельта, ждёт её окончания и запускается следом.
 
+    Возвращает (awaitable SyncResult, joined); joined — True, если
+    синхронизацию уже запустил кто-то другой и результат будет общим.
+    """
+    key = _sync_key(kind)
+    if full and _flights.running(key) and not _sync_full[kind]:
+        return _flights.start(f"{key}:full", lambda: _full_after_delta(kind))
+    return _flights.start(key, _sync_factory(kind, full))
 
-def update_single_stock(seller_sku_id, new_stock):
+
+def sync_running(kind):
+    """Идёт или ждёт своей очереди синхронизация kind в этом процессе"""
+    key = _sync_key(kind)
+    return _flights.running(key) or _flights.running(f"{key}:full")
+
+
+def start_sync_all(full=False):
+    """Запускает синхронизацию остатков и цен параллельно (или присоединяется к идущим).
+
+    Каждый конвейер завершается независимо: ошибка одного не скрывает
+    результат другого. Возвращает (awaitable (результат остатков, результат цен),
+    (stocks_joined, prices_joined)).
+    """
+    (stocks, stocks_joined), (prices, prices_joined) = start_sync("stocks", full), start_sync("prices", full)
+    return asyncio.gather(stocks, prices), (stocks_joined, prices_joined)
+
+
+async def update_single_stock(seller_sku_id, new_stock):
     """Обновляет остаток одного товара"""
     payload = {
         "stocks": [{
@@ -133,12 +912,14 @@ def update_single_stock(seller_sku_id, new_stock):
             "warehouse_id": WAREHOUSE_ID
         }]
     }
-    result = api_request(MAGNIT_STOCKS_URL, payload, f"Обновление остатка {seller_sku_id}")
+    result = await api_request(MAGNIT_STOCKS_URL, payload, f"Обновление остатка {seller_sku_id}", WRITE_POLICY, "Обновление остатка")
+    if result:
+        get_sync_state().save("stocks", [_snapshot_entry(row) for row in payload["stocks"]])
     return bool(
         result), f"Остаток {seller_sku_id} обновлен: {new_stock} шт" if result else f"Ошибка обновления остатка {seller_sku_id}"
 
 
-def update_single_price(seller_sku_id, new_price):
+async def update_single_price(seller_sku_id, new_price):
     """Обновляет цену одного товара"""
     payload = {
         "prices": [{
@@ -147,54 +928,71 @@ def update_single_price(seller_sku_id, new_price):
             "currency_code": "RUB"
         }]
     }
-    result = api_request(MAGNIT_PRICES_URL, payload, f"Обновление цены {seller_sku_id}")
+    result = await api_request(MAGNIT_PRICES_URL, payload, f"Обновление цены {seller_sku_id}", WRITE_POLICY, "Обновление цены")
+    if result:
+        get_sync_state().save("prices", [_snapshot_entry(row) for row in payload["prices"]])
     return bool(
         result), f"Цена {seller_sku_id} обновлена: {new_price} руб" if result else f"Ошибка обновления цены {seller_sku_id}"
 
-def get_stocks_info():
+async def get_stocks_info():
     """Получает информацию об остатках товаров из Magnit"""
+    try:
+        result, _ = await _flights.run("read:stocks_info", _stocks_info_read.fetch)
+        return result
+    except (ApiError, CircuitOpenError):
+        return _stocks_info_read.fallback(CatalogColumns(Catalog(), stock="q", reserved="q"))
+
+
+async def _fetch_stocks_info(policy=READ_POLICY):
     print("📊 Получаем информацию об остатках...")
-    products = get_all_products()
-    if not products:
-        return {}
+    catalog = await get_all_products()
+    result = CatalogColumns(catalog, stock="q", reserved="q")
+    if not catalog:
+        return result
 
-    sku_ids = list(products.keys())
     payload = {
-        "filter": {"sku_ids": [int(i) for i in sku_ids]},
-        "pagination": {"dir": "DESC", "page": 0, "page_size": len(sku_ids)}
+        "filter": {"sku_ids": catalog.sku_ids.tolist()},
+        "pagination": {"dir": "DESC", "page": 0, "page_size": len(catalog)}
     }
 
-    STOCKS_INFO_URL = "https://b2b-api.magnit.ru/api/seller/v1/products/sku/stocks/info"
-    data = api_request(STOCKS_INFO_URL, payload, "Получение остатков")
-    if not data:
-        return {}
-
-    result = {}
-    for item in data.get("result", []):
+    async for item in api_stream(MAGNIT_STOCKS_INFO_URL, payload, "Получение остатков", "result", policy=policy):
+        row = catalog.row(item.get("sku_id"))
+        if row is None:
+            continue
         for stock in item.get("stock_info_details", []):
             if stock["type"] == "FBS":
-                result[str(item["sku_id"])] = {
-                    "stock": stock["stock"],
-                    "reserved": stock["reserved"]
-                }
+                result.set(row, stock=stock["stock"], reserved=stock["reserved"])
 
-    print(f"✅ Получены остатки для {len(result)} товаров")
+    print(f"✅ Получены остатки для {result.count('stock')} товаров")
     return result
 
-def get_prices_info():
+
+_stocks_info_read = _guarded("stocks_info", _fetch_stocks_info)
+
+
+async def get_prices_info():
     """Получает информацию о ценах товаров из Magnit"""
+    try:
+        result, _ = await _flights.run("read:prices_info", _prices_info_read.fetch)
+        return result
+    except (ApiError, CircuitOpenError):
+        return _prices_info_read.fallback(CatalogColumns(Catalog(), price="d"))
+
+
+async def _fetch_prices_info(policy=READ_POLICY):
     print("💰 Получаем информацию о ценах...")
-    products = get_all_products()
-    if not products:
-        return {}
+    catalog = await get_all_products()
+    prices_info = CatalogColumns(catalog, price="d")
+    if not catalog:
+        return prices_info
 
     # Собираем seller_sku_ids всех товаров
-    seller_sku_ids = [product_info.get('seller_sku_id') for product_info in products.values()]
-    seller_sku_ids = [sku for sku in seller_sku_ids if sku and sku != 'N/A']
+    rows_by_seller_sku = {sku: row for row, sku in enumerate(catalog.seller_skus) if sku and sku != 'N/A'}
+    seller_sku_ids = list(rows_by_seller_sku)
 
     if not seller_sku_ids:
         print("❌ Не найдено seller_sku_ids для получения цен")
-        return {}
+        return prices_info
 
     # Формируем payload для запроса цен
     payload = {
@@ -208,24 +1006,37 @@ def get_prices_info():
         }
     }
 
-    MAGNIT_PRICES_INFO_URL = "https://b2b-api.magnit.ru/api/seller/v1/products/sku/price/info"
-    data = api_request(MAGNIT_PRICES_INFO_URL, payload, "Получение текущих цен из Magnit")
-    if not data:
-        return {}
-
-    prices_info = {}
-    items = data.get('result', [])
-
-    for item in items:
-        seller_sku_id = item.get('seller_sku_id')
+    async for item in api_stream(
+        MAGNIT_PRICES_INFO_URL, payload, "Получение текущих цен из Magnit", "result", policy=policy
+    ):
+        row = rows_by_seller_sku.get(item.get('seller_sku_id'))
         price = item.get('price', 0)
 
-        if seller_sku_id and price is not None:
+        if row is not None and price is not None:
             try:
-                price_value = float(price)
-                prices_info[seller_sku_id] = price_value
+                prices_info.set(row, price=float(price))
             except (ValueError, TypeError):
-                prices_info[seller_sku_id] = 0
+                prices_info.set(row, price=0)
+
+    print(f"✅ Получены цены для {prices_info.count('price')} товаров")
+    return prices_info
+
+
+_prices_info_read = _guarded("prices_info", _fetch_prices_info)
+
+
+def _collect_gauges():
+    """Состояние кэша каталога и автоматов на момент запроса метрик"""
+    cache = get_catalog_cache_stats()
+    states = (CircuitBreaker.CLOSED, CircuitBreaker.HALF_OPEN, CircuitBreaker.OPEN)
+    return [
+        ("catalog_cache_requests_total", "Обращения к кэшу каталога",
+         [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])], "counter"),
+        ("catalog_cache_size", "Товаров в кэше каталога", [({}, cache["size"])]),
+        ("circuit_breaker_state", "Состояние автомата чтения (1 - текущее)",
+         [({"read": name, "state": state}, int(read.breaker.state == state))
+          for name, read in _reads.items() for state in states]),
+    ]
+
 
-    print(f"✅ Получены цены для {len(prices_info)} товаров")
-    return prices_info
\ No newline at end of file
+REGISTRY.register_collector(_collect_gauges)
@@ -0,0 +1,150 @@
+import io
+import logging
+import re
+import unicodedata
+
+from telegram import InputFile
+from telegram.error import RetryAfter
+
+from config import TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST, TELEGRAM_GLOBAL_RATE, REPORT_DOCUMENT_PARTS
+from http_client import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Лимит длины сообщения Telegram (в UTF-16 единицах)
+MESSAGE_LIMIT = 4096
+SEND_ATTEMPTS = 3
+
+# Символы, которые продолжают предыдущий: ZWJ, вариационные селекторы, модификаторы тона, keycap
+_JOINERS = {"\u200d", "\ufe0e", "\ufe0f", "\u20e3"}
+_RECORD_RE = re.compile(r"(?<=\n\n)")
+
+_chat_buckets = {}
+_global_bucket = TokenBucket(TELEGRAM_GLOBAL_RATE, TELEGRAM_GLOBAL_RATE)
+
+
+def telegram_length(text):
+    """Длина текста так, как её считает Telegram"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _continues_previous(char):
+    return (
+        char in _JOINERS
+        or "\U0001f3fb" <= char <= "\U0001f3ff"
+        or unicodedata.combining(char)
+    )
+
+
+def _cut_line(line, limit):
+    """Режет слишком длинную строку по пробелу или хотя бы не посреди эмодзи"""
+    pieces = []
+    while telegram_length(line) > limit:
+        units = 0
+        for cut, char in enumerate(line):
+            units += 2 if ord(char) > 0xFFFF else 1
+            if units > limit:
+                break
+        space = line.rfind(" ", 0, cut)
+        if space > cut // 2:
+            cut = space + 1
+        else:
+            while cut > 1 and (_continues_previous(line[cut]) or line[cut - 1] == "\u200d"):
+                cut -= 1
+        pieces.append(line[:cut])
+        line = line[cut:]
+    pieces.append(line)
+    return pieces
+
+
+def _pieces(text, limit):
+    """Части текста, каждая не длиннее limit: записи, затем строки, затем куски строк"""
+    for record in _RECORD_RE.split(text):
+        if telegram_length(record) <= limit:
+            yield record
+            continue
+        for line in record.splitlines(keepends=True):
+            if telegram_length(line) <= limit:
+                yield line
+            else:
+                yield from _cut_line(line, limit)
+
+
+def split_message(text, limit=MESSAGE_LIMIT):
+    """Разбивает текст на сообщения по границам записей (пустая строка) и строк"""
+    if telegram_length(text) <= limit:
+        return [text]
+
+    parts = []
+    current = []
+    current_length = 0
+    for piece in _pieces(text, limit):
+        length = telegram_length(piece)
+        if current and current_length + length > limit:
+            parts.append("".join(current))
+            current = []
+            current_length = 0
+        current.append(piece)
+        current_length += length
+    if current:
+        parts.append("".join(current))
+    return [part.rstrip() for part in parts if part.strip()]
+
+
+def _retry_seconds(error):
+    retry_after = error.retry_after
+    return float(retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else retry_after)
+
+
+async def _paced(chat_id, send):
+    """Отправка с учётом лимитов Telegram на чат и на бота, с ожиданием при RetryAfter"""
+    bucket = _chat_buckets.get(chat_id)
+    if bucket is None:
+        bucket = _chat_buckets[chat_id] = TokenBucket(TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST)
+
+    for attempt in range(1, SEND_ATTEMPTS + 1):
+        await bucket.acquire()
+        await _global_bucket.acquire()
+        try:
+            return await send()
+        except RetryAfter as error:
+            if attempt == SEND_ATTEMPTS:
+                raise
+            delay = _retry_seconds(error)
+            logger.warning(f"⏳ Telegram RetryAfter для чата {chat_id}: ждём {delay:.0f} с")
+            bucket.pause(delay)
+
+
+async def reply(message, text, **kwargs):
+    """Отвечает на сообщение, разбивая длинный текст; клавиатура прикрепляется к последней части"""
+    reply_markup = kwargs.pop("reply_markup", None)
+    parts = split_message(text)
+    sent = None
+    for i, part in enumerate(parts):
+        markup = reply_markup if i == len(parts) - 1 else None
+        sent = await _paced(
+            message.chat_id,
+            lambda part=part, markup=markup: message.reply_text(part, reply_markup=markup, **kwargs),
+        )
+    return sent
+
+
+async def reply_report(message, text, filename="report.txt", caption=None):
+    """Отправляет отчёт: частями или, если частей больше REPORT_DOCUMENT_PARTS, одним файлом"""
+    parts = split_message(text)
+    if len(parts) <= REPORT_DOCUMENT_PARTS:
+        return await reply(message, text)
+
+    document = InputFile(io.BytesIO(text.encode("utf-8")), filename=filename)
+    return await _paced(
+        message.chat_id,
+        lambda: message.reply_document(document, caption=caption),
+    )
+
+
+async def edit(query, text, **kwargs):
+    """Редактирует сообщение с инлайн-кнопками с учётом лимитов Telegram"""
+    return await _paced(
+        query.message.chat_id if query.message else query.from_user.id,
+        lambda: query.edit_message_text(text, **kwargs),
+    )
@@ -0,0 +1,257 @@
+import functools
+import hmac
+import logging
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Тип содержимого текстового формата Prometheus
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Границы корзин гистограмм задержек, секунд
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SYNC_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: ожидаются метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+
+class Counter(_Metric):
+    """Монотонно растущий счётчик"""
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_value(self, key, value):
+        yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    """Распределение значений по корзинам, как в Prometheus"""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, (None, 0.0))
+            if counts is None:
+                counts = [0] * (len(self.buckets) + 1)
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def time(self, **labels):
+        """Контекстный менеджер, записывающий длительность блока"""
+        return _Timer(self, labels)
+
+    def _render_value(self, key, value):
+        counts, total = value
+        cumulative = 0
+        for bound, count in zip((*self.buckets, float("inf")), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = _format_labels(self.labelnames, key)
+        yield f"{self.name}_sum{labels} {_format_value(total)}"
+        yield f"{self.name}_count{labels} {cumulative}"
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._started = time.monotonic()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._histogram.observe(time.monotonic() - self._started, **self._labels)
+        return False
+
+
+class Registry:
+    """Набор метрик процесса и функций, отдающих значения gauge на момент запроса"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collect):
+        """collect() -> [(имя, описание, [({метки}, значение), ...][, тип]), ...] — текущие значения.
+
+        Тип по умолчанию gauge; монотонные значения отдаются с типом counter.
+        """
+        self._collectors.append(collect)
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            try:
+                gauges = collect()
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось собрать метрики: {e}")
+                continue
+            for name, documentation, samples, *kind in gauges:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind[0] if kind else 'gauge'}")
+                for labels, value in samples:
+                    label_text = _format_labels(labels.keys(), labels.values())
+                    lines.append(f"{name}{label_text} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Запросы к API маркетплейсов
+API_REQUEST_SECONDS = REGISTRY.histogram(
+    "marketplace_request_duration_seconds",
+    "Длительность запроса к API с учётом повторов",
+    ["endpoint", "operation"],
+)
+API_REQUEST_ERRORS = REGISTRY.counter(
+    "marketplace_request_errors_total",
+    "Неуспешные запросы к API по коду ответа (error - сбой соединения)",
+    ["endpoint", "status"],
+)
+API_REQUEST_RETRIES = REGISTRY.counter(
+    "marketplace_request_retries_total",
+    "Повторы запросов к API по причине",
+    ["endpoint", "reason"],
+)
+
+# Синхронизация остатков и цен
+SYNC_SECONDS = REGISTRY.histogram(
+    "sync_duration_seconds",
+    "Длительность синхронизации",
+    ["kind", "mode"],
+    buckets=SYNC_BUCKETS,
+)
+SYNC_SKUS = REGISTRY.counter(
+    "sync_skus_total",
+    "SKU, обработанные синхронизацией: sent, unchanged, failed",
+    ["kind", "outcome"],
+)
+SYNC_RUNS = REGISTRY.counter(
+    "sync_runs_total",
+    "Запуски синхронизации по результату",
+    ["kind", "status"],
+)
+SYNC_SKIPPED = REGISTRY.counter(
+    "sync_skipped_total",
+    "Пропущенные запуски автосинхронизации: running - предыдущий ещё идёт, locked - идёт на другом инстансе",
+    ["kind", "reason"],
+)
+
+# Обработка обновлений Telegram
+WEBHOOK_SECONDS = REGISTRY.histogram(
+    "webhook_update_duration_seconds",
+    "Время обработки одного обновления",
+    ["mode"],
+)
+WEBHOOK_QUEUE_LAG = REGISTRY.histogram(
+    "webhook_queue_lag_seconds",
+    "Сколько обновление ждало в очереди до начала обработки",
+)
+HANDLER_SECONDS = REGISTRY.histogram(
+    "bot_handler_duration_seconds",
+    "Длительность обработчиков бота",
+    ["handler"],
+)
+
+
+def observe_handler(func):
+    """Декоратор: записывает длительность асинхронного обработчика под его именем"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with HANDLER_SECONDS.time(handler=func.__name__):
+            return await func(*args, **kwargs)
+    return wrapper
+
+
+def authorized(authorization, token):
+    """Пускать ли к метрикам: без token доступ открыт, иначе нужен заголовок Bearer token"""
+    return not token or hmac.compare_digest((authorization or "").encode(), f"Bearer {token}".encode())
+
+
+def serve_metrics(port, token=""):
+    """Отдаёт метрики по HTTP в фоновом потоке (для режима polling)"""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):  # noqa: N802
+            if not authorized(self.headers.get("Authorization"), token):
+                self.send_response(401)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = REGISTRY.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"📈 Метрики доступны на порту {port}")
+    return server
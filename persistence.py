@@ -0,0 +1,215 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from config import STATE_BACKEND, STATE_DB_PATH, STATE_TTL_HOURS, KV_REST_API_URL, KV_REST_API_TOKEN
+
+logger = logging.getLogger(__name__)
+
+# Ключи user_data, которые переживают смену инстанса: шаг диалога и выбранный товар.
+# Всё остальное (кэши, большие структуры) остаётся только в памяти.
+PERSISTED_USER_KEYS = ("state", "selected_product")
+
+
+class MemoryStateStore:
+    """Хранилище в памяти процесса — для тестов и локального запуска"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._data = {}
+
+    async def get(self, key):
+        value, expires_at = self._data.get(key, (None, 0))
+        if value is None or expires_at < time.time():
+            return None
+        return json.loads(value)
+
+    async def set(self, key, data):
+        self._data[key] = (json.dumps(data), time.time() + self.ttl)
+
+    async def delete(self, key):
+        self._data.pop(key, None)
+
+
+class SqliteStateStore:
+    """Хранилище в файле SQLite: переживает перезапуск процесса на том же диске"""
+
+    def __init__(self, path, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS conversation_state (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+
+    async def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM conversation_state WHERE key = ? AND expires_at >= ?", (key, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def set(self, key, data):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO conversation_state (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(data), time.time() + self.ttl),
+            )
+
+    async def delete(self, key):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM conversation_state WHERE key = ?", (key,))
+
+
+class KvStateStore:
+    """Хранилище в Redis через REST API (Vercel KV / Upstash): общее для всех инстансов"""
+
+    def __init__(self, url, token, ttl):
+        self.url = url.rstrip("/")
+        self.ttl = ttl
+        self._headers = {"Authorization": f"Bearer {token}"}
+
+    async def _command(self, *command):
+        from http_client import get_client
+
+        response = await get_client(self.url).post(self.url, json=list(command), headers=self._headers)
+        response.raise_for_status()
+        return response.json().get("result")
+
+    async def get(self, key):
+        value = await self._command("GET", key)
+        return json.loads(value) if value else None
+
+    async def set(self, key, data):
+        await self._command("SET", key, json.dumps(data), "EX", int(self.ttl))
+
+    async def delete(self, key):
+        await self._command("DEL", key)
+
+    async def try_lock(self, key, ttl):
+        """Ставит блокировку с истечением через ttl секунд; False, если она уже стоит"""
+        return await self._command("SET", key, "1", "NX", "EX", int(ttl)) == "OK"
+
+
+class StatePersistence(BasePersistence):
+    """Persistence для Application, хранящая только PERSISTED_USER_KEYS из user_data.
+
+    Данные пользователя читаются из хранилища перед каждым обработчиком
+    (refresh_user_data) и записываются после каждого обновления, поэтому
+    многошаговый диалог продолжается на любом инстансе.
+    """
+
+    def __init__(self, store):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=60,
+        )
+        self.store = store
+
+    @staticmethod
+    def _key(user_id):
+        return f"fbs:user:{user_id}"
+
+    async def get_user_data(self):
+        # Данные пользователя подгружаются по требованию в refresh_user_data
+        return {}
+
+    async def update_user_data(self, user_id, data):
+        compact = {key: data[key] for key in PERSISTED_USER_KEYS if data.get(key) is not None}
+        try:
+            if compact:
+                await self.store.set(self._key(user_id), compact)
+            else:
+                await self.store.delete(self._key(user_id))
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить состояние пользователя {user_id}: {e}")
+
+    async def refresh_user_data(self, user_id, user_data):
+        try:
+            stored = await self.store.get(self._key(user_id))
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось загрузить состояние пользователя {user_id}: {e}")
+            return
+        for key in PERSISTED_USER_KEYS:
+            user_data.pop(key, None)
+        user_data.update(stored or {})
+
+    async def drop_user_data(self, user_id):
+        await self.store.delete(self._key(user_id))
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {}
+
+    async def update_conversation(self, name, key, new_state):
+        pass
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        pass
+
+
+def create_state_store(backend=None):
+    """Хранилище состояния по STATE_BACKEND: kv, sqlite, memory; none — без хранения"""
+    backend = backend or STATE_BACKEND
+    ttl = STATE_TTL_HOURS * 3600
+    if backend == "kv":
+        if not KV_REST_API_URL or not KV_REST_API_TOKEN:
+            raise RuntimeError("STATE_BACKEND=kv requires KV_REST_API_URL and KV_REST_API_TOKEN")
+        return KvStateStore(KV_REST_API_URL, KV_REST_API_TOKEN, ttl)
+    if backend == "sqlite":
+        return SqliteStateStore(STATE_DB_PATH, ttl)
+    if backend == "memory":
+        return MemoryStateStore(ttl)
+    if backend == "none":
+        return None
+    raise RuntimeError(f"Unknown STATE_BACKEND: {backend}")
+
+
+def create_persistence():
+    """Persistence для Application или None, если состояние не сохраняется"""
+    store = create_state_store()
+    return StatePersistence(store) if store is not None else None
+
+
+async def save_user_state(update, context):
+    """Сохраняет состояние пользователя сразу после обработки обновления"""
+    if update.effective_user is None:
+        return
+    context.application.mark_data_for_update_persistence(user_ids=update.effective_user.id)
+    await context.application.update_persistence()
@@ -0,0 +1,108 @@
+import importlib
+import logging
+
+from config import (
+    AUTO_SYNC_STOCKS_MINUTES, AUTO_SYNC_PRICES_MINUTES, AUTO_SYNC_JITTER_SECONDS, AUTO_SYNC_LOCK_TTL,
+    KV_REST_API_URL, KV_REST_API_TOKEN,
+)
+from metrics import SYNC_SKIPPED
+
+logger = logging.getLogger(__name__)
+
+# Вид синхронизации -> интервал в минутах
+SCHEDULED_SYNCS = {
+    "stocks": AUTO_SYNC_STOCKS_MINUTES,
+    "prices": AUTO_SYNC_PRICES_MINUTES,
+}
+
+
+def enabled_syncs():
+    """Виды синхронизации с ненулевым интервалом"""
+    return [kind for kind, minutes in SCHEDULED_SYNCS.items() if minutes > 0]
+
+
+def _lock_store():
+    """KV для блокировки между инстансами или None, если KV не настроен"""
+    if not KV_REST_API_URL or not KV_REST_API_TOKEN:
+        return None
+    from persistence import KvStateStore
+    return KvStateStore(KV_REST_API_URL, KV_REST_API_TOKEN, AUTO_SYNC_LOCK_TTL)
+
+
+async def run_scheduled_sync(kind):
+    """Запускает синхронизацию kind, если такая же ещё не идёт.
+
+    Пока идёт предыдущий запуск — в этом процессе (в том числе начатый
+    администратором) или, при настроенном KV, на другом инстансе, — новый
+    пропускается, а не ждёт своей очереди. Возвращает SyncResult или None,
+    если запуск пропущен.
+    """
+    magnit_api = importlib.import_module("magnit_api")
+    if magnit_api.sync_running(kind):
+        logger.info(f"⏭ Автосинхронизация {kind} пропущена: предыдущая ещё идёт")
+        SYNC_SKIPPED.inc(kind=kind, reason="running")
+        return None
+
+    store = _lock_store()
+    lock_key = f"fbs:sync-lock:{kind}"
+    if store is not None:
+        try:
+            locked = await store.try_lock(lock_key, AUTO_SYNC_LOCK_TTL)
+        except Exception as e:
+            # Без KV остаётся объединение запусков внутри процесса
+            logger.warning(f"⚠️ Не удалось поставить блокировку {kind} в KV: {e}")
+            store, locked = None, True
+        if not locked:
+            logger.info(f"⏭ Автосинхронизация {kind} пропущена: идёт на другом инстансе")
+            SYNC_SKIPPED.inc(kind=kind, reason="locked")
+            return None
+
+    try:
+        logger.info(f"⏰ Автосинхронизация {kind}")
+        run, _ = magnit_api.start_sync(kind)
+        result = await run
+        logger.info(f"{'✅' if result.success else '❌'} Автосинхронизация {kind}: {result.message}")
+        return result
+    finally:
+        if store is not None:
+            try:
+                await store.delete(lock_key)
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось снять блокировку {kind} в KV: {e}")
+
+
+async def _sync_job(context):
+    await run_scheduled_sync(context.job.data)
+
+
+def schedule_syncs(application):
+    """Ставит автосинхронизацию в JobQueue приложения (режим polling)"""
+    if not enabled_syncs():
+        logger.info("⏰ Автосинхронизация выключена (AUTO_SYNC_STOCKS_MINUTES, AUTO_SYNC_PRICES_MINUTES)")
+        return
+
+    job_queue = application.job_queue
+    if job_queue is None:
+        logger.warning(
+            "⚠️ JobQueue недоступна (нужен python-telegram-bot[job-queue]), автосинхронизация выключена"
+        )
+        return
+
+    for kind in enabled_syncs():
+        interval = SCHEDULED_SYNCS[kind] * 60
+        job_queue.run_repeating(
+            _sync_job,
+            interval=interval,
+            first=interval,
+            name=f"auto_sync_{kind}",
+            data=kind,
+            job_kwargs={
+                # Случайный сдвиг, чтобы запуски не совпадали с другими ботами и друг с другом
+                "jitter": AUTO_SYNC_JITTER_SECONDS or None,
+                # Медленный запуск не накладывается на следующий, пропущенные не догоняются
+                "max_instances": 1,
+                "coalesce": True,
+                "misfire_grace_time": max(1, int(interval / 2)),
+            },
+        )
+        logger.info(f"⏰ Автосинхронизация {kind}: каждые {interval / 60:g} мин")
@@ -0,0 +1,42 @@
+import asyncio
+
+
+class SingleFlight:
+    """Объединение одинаковых одновременных операций.
+
+    Пока операция с ключом key выполняется, следующие вызовы с тем же ключом
+    не запускают её повторно, а ждут и получают тот же результат (или ту же
+    ошибку). Отмена одного из ждущих не отменяет саму операцию.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    def running(self, key):
+        return key in self._calls
+
+    def start(self, key, factory):
+        """Запускает factory() или присоединяется к идущему вызову.
+
+        Возвращает (awaitable результата, joined), где joined — True, если
+        операция уже шла и вызывающий присоединился к ней.
+        """
+        task = self._calls.get(key)
+        joined = task is not None
+        if not joined:
+            task = asyncio.ensure_future(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return asyncio.shield(task), joined
+
+    async def run(self, key, factory):
+        """Как start, но сразу ждёт результат: возвращает (результат, joined)"""
+        awaitable, joined = self.start(key, factory)
+        return await awaitable, joined
+
+    def _finish(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Ошибку уже получили ждущие; если их не осталось, не пишем "exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
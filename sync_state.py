@@ -0,0 +1,75 @@
+import sqlite3
+import threading
+import time
+
+from config import SYNC_STATE_PATH
+
+
+class SyncState:
+    """Снимок значений, последними успешно отправленных в Magnit.
+
+    Ключ — (вид данных, seller_sku_id, warehouse_id), для цен склад пустой.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS snapshot (
+                kind TEXT NOT NULL,
+                seller_sku_id TEXT NOT NULL,
+                warehouse_id TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (kind, seller_sku_id, warehouse_id)
+            );
+            CREATE TABLE IF NOT EXISTS full_sync (
+                kind TEXT PRIMARY KEY,
+                synced_at REAL NOT NULL
+            );
+            """
+        )
+
+    def load(self, kind):
+        """Возвращает снимок {(seller_sku_id, warehouse_id): value}"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seller_sku_id, warehouse_id, value FROM snapshot WHERE kind = ?", (kind,)
+            ).fetchall()
+        return {(sku, warehouse): value for sku, warehouse, value in rows}
+
+    def save(self, kind, entries):
+        """Сохраняет отправленные значения: entries — [(seller_sku_id, warehouse_id, value)]"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO snapshot (kind, seller_sku_id, warehouse_id, value) "
+                "VALUES (?, ?, ?, ?)",
+                [(kind, sku, warehouse, value) for sku, warehouse, value in entries],
+            )
+
+    def last_full_sync(self, kind):
+        """Время последней полной синхронизации (0, если её не было)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT synced_at FROM full_sync WHERE kind = ?", (kind,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def mark_full_sync(self, kind, synced_at=None):
+        """Запоминает время успешной полной синхронизации"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO full_sync (kind, synced_at) VALUES (?, ?)",
+                (kind, synced_at or time.time()),
+            )
+
+
+_state = None
+
+
+def get_sync_state():
+    """Возвращает общий снимок синхронизации"""
+    global _state
+    if _state is None:
+        _state = SyncState(SYNC_STATE_PATH)
+    return _state
@@ -0,0 +1,28 @@
+import os
+import sys
+
+import httpx
+import pytest
+
+# config.py читает окружение при импорте, поэтому переменные задаются до импорта модулей бота
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:test")
+os.environ.setdefault("MAGNIT_API_KEY", "test")
+os.environ.setdefault("OZON_API_KEY", "test")
+os.environ.setdefault("OZON_CLIENT_ID", "test")
+os.environ.setdefault("WAREHOUSE_ID", "1")
+os.environ.setdefault("STATE_BACKEND", "memory")
+os.environ.setdefault("VERCEL", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def mock_api(monkeypatch):
+    """Подменяет HTTP-клиент маркетплейсов: mock_api(handler), handler(request) -> httpx.Response"""
+    import http_client
+
+    def install(handler):
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr(http_client, "get_client", lambda url: client)
+        return client
+
+    return install
@@ -0,0 +1,111 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import magnit_api
+from http_client import RetryPolicy
+from json_stream import JsonArrayStream
+
+ITEMS = [{"sku_id": i} for i in range(5)]
+BODY = json.dumps({"result": ITEMS, "cursor": "next"}).encode()
+POLICY = RetryPolicy(attempts=3, retry_statuses=frozenset(), base_delay=0, max_delay=0)
+
+
+class BrokenStream(httpx.AsyncByteStream):
+    """Тело ответа, которое обрывается после cut байт"""
+
+    def __init__(self, cut):
+        self.cut = cut
+
+    async def __aiter__(self):
+        yield BODY[:self.cut]
+        raise httpx.ReadError("connection reset")
+
+
+def serve(mock_api, broken):
+    """Первые broken ответов обрываются на середине третьего товара, остальные целые"""
+    calls = []
+
+    def handler(request):
+        calls.append(json.loads(request.content))
+        if len(calls) <= broken:
+            return httpx.Response(200, stream=BrokenStream(BODY.index(b'{"sku_id": 3}') - 5))
+        return httpx.Response(200, content=BODY)
+
+    mock_api(handler)
+    return calls
+
+
+async def collect(policy):
+    fields = {}
+    items = [
+        item async for item in magnit_api.api_stream(
+            magnit_api.PRODUCTS_URL, {"limit": 5}, "Тест", "result", fields, policy=policy
+        )
+    ]
+    return items, fields
+
+
+def test_interrupted_response_is_resumed_without_duplicates(mock_api):
+    calls = serve(mock_api, broken=2)
+
+    items, fields = asyncio.run(collect(POLICY))
+
+    assert items == ITEMS
+    assert fields["cursor"] == "next"
+    assert calls == [{"limit": 5}] * 3
+
+
+def test_interruption_raises_api_error_when_attempts_run_out(mock_api):
+    calls = serve(mock_api, broken=3)
+
+    with pytest.raises(magnit_api.ApiError):
+        asyncio.run(collect(POLICY))
+    assert len(calls) == 3
+
+
+SPLIT_BODIES = [
+    {"items": [1.5, 2, -3, 0.25], "total": 1e10},
+    {"items": [{"price": -12.75e-2, "stock": 1000000}, {"price": 3E+2}], "cursor": "abc"},
+    {"items": ["строка", "esc \"q\" \\ \n \t é 😀", ""], "last_id": "x,y]}"},
+    {"meta": {"a": [1, {"b": [2.5, None, True, False]}]}, "items": [{"x": {"y": {"z": [1, [2, [3.0]]]}}}]},
+    {"items": [], "total": 0},
+]
+
+
+def parse_chunks(body, chunks):
+    stream = JsonArrayStream("items")
+    items = []
+    for chunk in chunks:
+        items.extend(stream.feed(chunk))
+    items.extend(stream.close())
+    fields = {name: value for name, value in stream.fields.items() if name != "items"}
+    return items, fields
+
+
+def expected(document):
+    return document["items"], {name: value for name, value in document.items() if name != "items"}
+
+
+@pytest.mark.parametrize("document", SPLIT_BODIES)
+@pytest.mark.parametrize("size", [1, 2, 3])
+def test_body_fed_in_small_chunks(document, size):
+    body = json.dumps(document, ensure_ascii=False).encode("utf-8")
+    chunks = [body[i:i + size] for i in range(0, len(body), size)]
+
+    assert parse_chunks(body, chunks) == expected(document)
+
+
+@pytest.mark.parametrize("document", SPLIT_BODIES)
+def test_body_split_at_every_offset(document):
+    body = json.dumps(document, ensure_ascii=False).encode("utf-8")
+    for offset in range(len(body) + 1):
+        assert parse_chunks(body, [body[:offset], body[offset:]]) == expected(document), offset
+
+
+def test_truncated_body_raises():
+    body = b'{"items": [1.5, 2], "total": 1'
+    with pytest.raises(ValueError):
+        parse_chunks(body, [body[:-5]])
@@ -0,0 +1,42 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import magnit_api
+
+TOTAL = magnit_api.ORDERS_PAGE_LIMIT * 3
+
+
+@pytest.fixture
+def offsets(mock_api, monkeypatch):
+    """Стенд списка заказов: TOTAL заказов постранично по offset; возвращает запрошенные offset"""
+    offsets = []
+
+    def handler(request):
+        payload = json.loads(request.content)
+        offset = payload["offset"]
+        offsets.append(offset)
+        end = min(offset + payload["limit"], TOTAL)
+        return httpx.Response(200, json={"orders": [{"order_id": n, "status": "NEW"} for n in range(offset, end)]})
+
+    mock_api(handler)
+    monkeypatch.setattr(magnit_api._orders_read, "value", None)
+    return offsets
+
+
+def test_partial_walk_does_not_replace_saved_orders(offsets):
+    orders = asyncio.run(magnit_api.get_unprocessed_orders(max_orders=5))
+
+    assert [order["order_id"] for order in orders] == list(range(5))
+    assert magnit_api._orders_read.value is None
+    # Заранее запрошенная вторая страница отменяется при выходе, третья не запрашивается
+    assert 2 * magnit_api.ORDERS_PAGE_LIMIT not in offsets
+
+
+def test_full_walk_saves_all_orders(offsets):
+    orders = asyncio.run(magnit_api.get_unprocessed_orders())
+
+    assert len(orders) == TOTAL
+    assert len(magnit_api._orders_read.value) == TOTAL
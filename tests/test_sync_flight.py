@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+import magnit_api
+
+
+@pytest.fixture
+def runs(monkeypatch):
+    """Синхронизации-заглушки: пишут в runs (вид, полная), следят, что один вид не идёт дважды"""
+    runs = []
+    running = set()
+
+    def make(kind):
+        async def sync(full=False):
+            assert kind not in running, f"две синхронизации {kind} одновременно"
+            running.add(kind)
+            runs.append((kind, full))
+            await asyncio.sleep(0.05)
+            running.discard(kind)
+            return magnit_api.SyncResult(total=1, sent=1, full=full)
+        return sync
+
+    monkeypatch.setitem(magnit_api._SYNCS, "stocks", make("stocks"))
+    monkeypatch.setitem(magnit_api._SYNCS, "prices", make("prices"))
+    return runs
+
+
+def test_full_sync_waits_for_running_delta(runs):
+    async def scenario():
+        delta, delta_joined = magnit_api.start_sync("stocks")
+        full, full_joined = magnit_api.start_sync("stocks", full=True)
+        again, again_joined = magnit_api.start_sync("stocks", full=True)
+        results = await asyncio.gather(delta, full, again)
+        return results, (delta_joined, full_joined, again_joined)
+
+    results, joined = asyncio.run(scenario())
+
+    assert runs == [("stocks", False), ("stocks", True)]
+    assert [result.full for result in results] == [False, True, True]
+    assert joined == (False, False, True)
+    assert not magnit_api.sync_running("stocks")
+
+
+def test_delta_joins_running_full(runs):
+    async def scenario():
+        full, _ = magnit_api.start_sync("prices", full=True)
+        delta, joined = magnit_api.start_sync("prices")
+        return await asyncio.gather(full, delta), joined
+
+    results, joined = asyncio.run(scenario())
+
+    assert runs == [("prices", True)]
+    assert joined
@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+from update_processor import ChatOrderedUpdateProcessor
+from webhook_runtime import WebhookRuntime
+
+
+class FakeApplication:
+    """Application, у которого обработка обновления — пауза из текста сообщения"""
+
+    def __init__(self, max_running):
+        self.bot = None
+        self.update_processor = ChatOrderedUpdateProcessor(max_running, 256)
+        self.finished = []
+
+    async def process_update(self, update):
+        await asyncio.sleep(float(update.message.text))
+        self.finished.append((update.effective_chat.id, update.update_id, time.monotonic()))
+
+    async def stop(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+def make_update(update_id, chat_id, seconds):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Test"},
+            "text": str(seconds),
+        },
+    }
+
+
+def test_busy_chat_does_not_block_other_chats_in_queue():
+    runtime = WebhookRuntime()
+    application = FakeApplication(max_running=8)
+    runtime._application = application
+    try:
+        started = time.monotonic()
+        # Один занятый администратор присылает больше обновлений, чем мест в пуле
+        for update_id in range(1, 10):
+            runtime.enqueue(make_update(update_id, chat_id=1, seconds=0.2))
+        runtime.enqueue(make_update(100, chat_id=2, seconds=0.01))
+
+        deadline = time.monotonic() + 5
+        while len(application.finished) < 10 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        runtime.shutdown()
+
+    finished = {update_id: at - started for _, update_id, at in application.finished}
+    assert len(finished) == 10
+    # Обновление второго чата не ждёт очередь первого
+    assert finished[100] < 0.15
+    # Обновления первого чата выполнены по порядку
+    chat_1 = [update_id for chat_id, update_id, _ in application.finished if chat_id == 1]
+    assert chat_1 == list(range(1, 10))
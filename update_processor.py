@@ -0,0 +1,62 @@
+import asyncio
+
+from telegram.ext import BaseUpdateProcessor
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений с сохранением порядка внутри чата.
+
+    Обновления разных чатов обрабатываются одновременно, не больше
+    max_running сразу; обновления одного чата — строго по очереди, поэтому
+    шаги диалога (waiting_*_product -> waiting_*_value) не перемешиваются,
+    а долгая синхронизация одного администратора не держит остальных.
+
+    Обновление, ждущее свой чат, не занимает место в пуле обработки.
+    max_pending (лимит базового класса) ограничивает число принятых,
+    но ещё не обработанных обновлений.
+    """
+
+    def __init__(self, max_running, max_pending):
+        super().__init__(max(max_pending, max_running))
+        self.max_running = max_running
+        self._running = asyncio.Semaphore(max_running)
+        # chat_id -> [блокировка, сколько обновлений чата её ждут или держат]
+        self._chats = {}
+
+    @staticmethod
+    def _chat_key(update):
+        chat = getattr(update, "effective_chat", None)
+        if chat is not None:
+            return chat.id
+        user = getattr(update, "effective_user", None)
+        return user.id if user is not None else None
+
+    async def do_process_update(self, update, coroutine):
+        key = self._chat_key(update)
+        if key is None:
+            async with self._running:
+                await coroutine
+            return
+
+        entry = self._chats.get(key)
+        if entry is None:
+            entry = self._chats[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            # asyncio.Lock отдаётся ждущим в порядке очереди, то есть в порядке поступления обновлений
+            async with entry[0], self._running:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chats[key]
+
+    def active_chats(self):
+        """Сколько чатов сейчас обрабатывается или ждёт обработки"""
+        return len(self._chats)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+
+from config import UPDATE_MAX_PENDING
+from metrics import WEBHOOK_SECONDS, WEBHOOK_QUEUE_LAG
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookRuntime:
+    """Один event loop и одно инициализированное Application на весь срок жизни инстанса.
+
+    Loop крутится в фоновом потоке, HTTP-обработчик лишь передаёт в него корутины,
+    поэтому пулы соединений бота и API маркетплейсов живут между запросами.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._application = None
+        self._application_lock = None
+        self._queue = None
+        self._dispatcher = None
+        self._slots = None
+        self._tasks = set()
+        self._pending = deque()
+        self._last_lag = 0.0
+        self.processed = 0
+        self.failed = 0
+
+    def _ensure_loop(self):
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="webhook-loop", daemon=True)
+                thread.start()
+                self._loop = loop
+                self._thread = thread
+                logger.info("🔁 Webhook event loop started")
+        return self._loop
+
+    def submit(self, coro):
+        """Запускает корутину в общем loop, возвращает concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def run(self, coro, timeout=None):
+        """Выполняет корутину в общем loop и ждёт результат из текущего потока"""
+        return self.submit(coro).result(timeout)
+
+    async def get_application(self):
+        """Создаёт и инициализирует Application при первом обращении"""
+        if self._application is None:
+            if self._application_lock is None:
+                self._application_lock = asyncio.Lock()
+            async with self._application_lock:
+                if self._application is None:
+                    logger.info("🚀 Initializing application...")
+                    # bot (и telegram) импортируется при первом обновлении, а не при импорте модуля
+                    from bot import initialize_application
+                    self._application = await initialize_application()
+                    logger.info("✅ Application initialized and started")
+        return self._application
+
+    async def process_update(self, update_data: dict) -> None:
+        """Обрабатывает обновление Telegram готовым приложением"""
+        from bot import process_update_with_application
+
+        application = await self.get_application()
+        await process_update_with_application(update_data, application)
+
+    def enqueue(self, update_data: dict) -> None:
+        """Ставит обновление в очередь фоновой обработки и сразу возвращается"""
+        received_at = time.time()
+        self._ensure_loop().call_soon_threadsafe(self._put, update_data, received_at)
+
+    def _put(self, update_data, received_at):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(UPDATE_MAX_PENDING)
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+        self._pending.append(received_at)
+        self._queue.put_nowait((update_data, received_at))
+
+    async def _dispatch(self):
+        """Забирает обновления из очереди по порядку и запускает каждое отдельной задачей.
+
+        Сколько обновлений выполняется одновременно и порядок внутри чата
+        определяет update_processor приложения. Обновление, ждущее свой чат,
+        не держит очередь: обновления других чатов запускаются сразу.
+        Одновременно запущено не больше UPDATE_MAX_PENDING задач.
+        """
+        while True:
+            update_data, received_at = await self._queue.get()
+            await self._slots.acquire()
+            self._pending.popleft()
+            self._last_lag = time.time() - received_at
+            WEBHOOK_QUEUE_LAG.observe(self._last_lag)
+            task = asyncio.get_running_loop().create_task(self._process_queued(update_data))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _process_queued(self, update_data):
+        try:
+            with WEBHOOK_SECONDS.time(mode="queued"):
+                await self.process_update(update_data)
+            self.processed += 1
+        except Exception as exc:  # pylint: disable=broad-except
+            self.failed += 1
+            logger.exception("❌ Queued update failed: %s", exc)
+        finally:
+            self._slots.release()
+            self._queue.task_done()
+
+    def queue_stats(self) -> dict:
+        """Глубина очереди и задержка обработки, секунд"""
+        try:
+            oldest_age = time.time() - self._pending[0]
+        except IndexError:
+            oldest_age = 0.0
+        return {
+            "depth": len(self._pending),
+            "oldest_age": round(oldest_age, 3),
+            "last_lag": round(self._last_lag, 3),
+            "processed": self.processed,
+            "failed": self.failed,
+        }
+
+    async def _shutdown_async(self):
+        if self._queue is not None:
+            await self._queue.join()
+            self._dispatcher.cancel()
+            self._queue = None
+            self._dispatcher = None
+        if self._application is not None:
+            await self._application.stop()
+            await self._application.shutdown()
+            self._application = None
+        from http_client import close_clients
+        await close_clients()
+
+    def shutdown(self):
+        """Останавливает приложение и фоновый loop"""
+        if self._loop is None:
+            return
+        self.run(self._shutdown_async())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+        self._thread = None